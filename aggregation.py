@@ -0,0 +1,77 @@
+import pandas as pd
+from instrumentation import span
+
+
+class CohortAggregates:
+    """
+    Memoized aggregates of the preprocessed entries of one cohort.
+    Every aggregate is computed on first access and shared by all tests and plots afterwards.
+    Call invalidate (or update with the new entries) whenever the underlying data changes.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self._data = data
+        self._cache = dict()
+
+    @property
+    def data(self):
+        return self._data
+
+    def update(self, data: pd.DataFrame):
+        self._data = data
+        self.invalidate()
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def _memoize(self, key, compute):
+        if key not in self._cache:
+            with span(f"aggregate {key}"):
+                self._cache[key] = compute()
+        return self._cache[key]
+
+    def user_skill_mean(self):
+        """
+        Mean of every column per User and ExerciseSkill
+        """
+        return self._memoize(
+            "user_skill_mean",
+            lambda: self._data.groupby(["User", "ExerciseSkill"], observed=True).mean(
+                numeric_only=True
+            ),
+        )
+
+    def user_mean(self):
+        """
+        Mean of every column per User over all of their exercises
+        """
+        return self._memoize(
+            "user_mean",
+            lambda: self._data.drop(columns="ExerciseSkill").groupby(["User"]).mean(),
+        )
+
+    def _user_skill_summary(self):
+        # Mean and standard deviation of the skill means of each user, computed within one pass
+        return self._memoize(
+            "user_skill_summary",
+            lambda: self.user_skill_mean().groupby(["User"]).agg(["mean", "std"]),
+        )
+
+    def user_skill_std(self):
+        """
+        Standard deviation of the skill means of each user
+        """
+        return self._user_skill_summary().xs("std", axis=1, level=1)
+
+    def user_skill_cv(self):
+        """
+        Coefficient of Variation (CV, in %) of the skill means of each user
+        """
+        return self._memoize(
+            "user_skill_cv",
+            lambda: (
+                self._user_skill_summary().xs("std", axis=1, level=1)
+                / self._user_skill_summary().xs("mean", axis=1, level=1)
+            )
+            * 100,
+        )
@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+from rank_tests import rank_test_rows
+from util import render_comparison_histogram
+
+# Test names match the ones reported by util.perform_test
+TEST_NAMES = {
+    (True, True): "paired t-test",
+    (True, False): "Wilcoxon test",
+    (False, True): "t-test",
+    (False, False): "Mann-Whitney U test",
+}
+
+CORRECTIONS = ["bonferroni", "holm", "fdr_bh"]
+
+
+def _shapiro_rows(values):
+    from scipy.stats import shapiro
+
+    # The Shapiro-Wilk test is only defined for at least 3 observations
+    if values.shape[1] < 3:
+        return np.full(values.shape[0], np.nan)
+    return np.atleast_1d(shapiro(values, axis=1).pvalue)
+
+
+@traced()
+def test_matrix(a, b, is_related, is_graph_norm, norm_val=0.05, alternative="greater"):
+    """
+    Runs the test selection of util.perform_test for every row of the 2D arrays a and b at once.
+    Rows of a and b are compared with each other, for related tests both must have the same shape.
+    """
+    from scipy.stats import ttest_rel, ttest_ind
+
+    a, b = np.atleast_2d(np.asarray(a, dtype=float)), np.atleast_2d(
+        np.asarray(b, dtype=float)
+    )
+    if a.shape[1] == 0 or b.shape[1] == 0:
+        raise ValueError("Input arrays must not be empty.")
+
+    norm_p_a = _shapiro_rows(a)
+    norm_p_b = _shapiro_rows(b)
+    # NaN p-values (too few observations) never pass the normality screen
+    is_normal = is_graph_norm & (norm_p_a >= norm_val) & (norm_p_b >= norm_val)
+
+    statistic = np.empty(a.shape[0])
+    pvalue = np.empty(a.shape[0])
+
+    if is_normal.any():
+        ttest = ttest_rel if is_related else ttest_ind
+        result = ttest(a[is_normal], b[is_normal], alternative=alternative, axis=1)
+        statistic[is_normal] = result.statistic
+        pvalue[is_normal] = result.pvalue
+
+    if (~is_normal).any():
+        statistic[~is_normal], pvalue[~is_normal] = rank_test_rows(
+            a[~is_normal], b[~is_normal], is_related, alternative
+        )
+
+    test_name = np.where(
+        is_normal, TEST_NAMES[(is_related, True)], TEST_NAMES[(is_related, False)]
+    )
+
+    return {
+        "norm_p_a": norm_p_a,
+        "norm_p_b": norm_p_b,
+        "test": test_name,
+        "statistic": statistic,
+        "p": pvalue,
+    }
+
+
+def adjust_pvalues(pvalues, method):
+    """
+    Adjusts p-values for multiple comparisons (bonferroni, holm or fdr_bh), NaN values are ignored
+    """
+    if method not in CORRECTIONS:
+        raise ValueError(method)
+
+    pvalues = np.asarray(pvalues, dtype=float)
+    adjusted = np.full(pvalues.shape, np.nan)
+    valid = ~np.isnan(pvalues)
+    p = pvalues[valid]
+    m = len(p)
+
+    if method == "bonferroni":
+        result = p * m
+    else:
+        order = np.argsort(p)
+        ranked = p[order]
+        if method == "holm":
+            result = np.maximum.accumulate((m - np.arange(m)) * ranked)
+        else:
+            result = np.minimum.accumulate((m / np.arange(m, 0, -1) * ranked[::-1]))[
+                ::-1
+            ]
+        result = result[np.argsort(order)]
+
+    adjusted[valid] = np.minimum(result, 1)
+    return adjusted
+
+
+def _split_groups(df, by, group, value, a, b, pair):
+    keys, samples_a, samples_b = [], [], []
+
+    for key, entries in df.groupby(by, sort=True, observed=True):
+        if pair is not None:
+            paired = entries.pivot_table(
+                index=pair, columns=group, values=value, aggfunc="mean"
+            )
+            if a not in paired or b not in paired:
+                continue
+            paired = paired[[a, b]].dropna()
+            values_a, values_b = paired[a].to_numpy(), paired[b].to_numpy()
+        else:
+            values_a = entries.loc[entries[group] == a, value].to_numpy()
+            values_b = entries.loc[entries[group] == b, value].to_numpy()
+
+        if len(values_a) == 0 or len(values_b) == 0:
+            continue
+
+        keys.append(key if isinstance(key, tuple) else (key,))
+        samples_a.append(values_a.astype(float))
+        samples_b.append(values_b.astype(float))
+
+    return keys, samples_a, samples_b
+
+
+@traced()
+def perform_tests(
+    df,
+    by,
+    group,
+    value,
+    a,
+    b,
+    is_related,
+    is_graph_norm,
+    norm_val=0.05,
+    alternative="greater",
+    pair=None,
+    correction=None,
+    plot=False,
+    x_label="Score",
+    output_dir="img",
+):
+    """
+    Batched version of util.perform_test for long-format data.
+    For every group of the `by` columns, the `value` entries where `group` equals `a` are compared with the ones where it equals `b`.
+    Related samples are aligned by the `pair` column (e.g. User), otherwise by their order within the frame.
+    Groups with the same sample sizes are tested within a single vectorized scipy call.
+    Returns one row per group, the p-values are adjusted if a correction (bonferroni, holm, fdr_bh) is given.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    keys, samples_a, samples_b = _split_groups(df, by, group, value, a, b, pair)
+
+    columns = ["norm_p_a", "norm_p_b", "test", "statistic", "p"]
+    results = {column: np.empty(len(keys), dtype=object) for column in columns}
+
+    buckets = dict()
+    for i, (values_a, values_b) in enumerate(zip(samples_a, samples_b)):
+        buckets.setdefault((len(values_a), len(values_b)), []).append(i)
+
+    for (n_a, n_b), rows in buckets.items():
+        rows = np.asarray(rows)
+        if is_related and n_a != n_b:
+            raise ValueError(f"Related samples differ in size ({n_a} and {n_b}).")
+
+        tested = test_matrix(
+            np.stack([samples_a[i] for i in rows]),
+            np.stack([samples_b[i] for i in rows]),
+            is_related=is_related,
+            is_graph_norm=is_graph_norm,
+            norm_val=norm_val,
+            alternative=alternative,
+        )
+        for column in columns:
+            results[column][rows] = tested[column]
+
+    table = pd.DataFrame(keys, columns=by)
+    table["n_a"] = [len(values) for values in samples_a]
+    table["n_b"] = [len(values) for values in samples_b]
+    table["mean_a"] = [np.mean(values) for values in samples_a]
+    table["mean_b"] = [np.mean(values) for values in samples_b]
+    table["std_a"] = [np.std(values, ddof=1) for values in samples_a]
+    table["std_b"] = [np.std(values, ddof=1) for values in samples_b]
+    for column in columns:
+        table[column] = results[column]
+    table = table.astype(
+        {"norm_p_a": float, "norm_p_b": float, "statistic": float, "p": float}
+    )
+
+    if correction is not None:
+        table["p_adjusted"] = adjust_pvalues(table["p"], correction)
+
+    if plot:
+        for key, values_a, values_b in zip(keys, samples_a, samples_b):
+            render_comparison_histogram(
+                a=values_a,
+                b=values_b,
+                a_name=str(a),
+                b_name=str(b),
+                x_label=x_label,
+                filename="_".join(map(str, key)),
+                output_dir=output_dir,
+            )
+
+    return table
@@ -0,0 +1,77 @@
+"""
+Import-time benchmark for the helper module and the study scripts.
+
+Every module is imported within a fresh interpreter, as it happens for the short-lived batch jobs.
+The run fails if the median import time exceeds the budget or if a heavy dependency is imported eagerly.
+
+    python benchmarks/import_time.py [--runs 7] [--budget 1.0]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["util", "data_preparation", "pre_study", "main_study"]
+
+# Modules which must only be loaded on first use of a plot or a statistical test
+LAZY_MODULES = ["matplotlib", "seaborn", "scipy"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {lazy!r} if name in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure(module, runs):
+    timings = []
+    loaded = []
+
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, lazy=LAZY_MODULES)],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        probe = json.loads(output.splitlines()[-1])
+        timings.append(probe["elapsed"])
+        loaded = probe["loaded"]
+
+    return statistics.median(timings), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument(
+        "--budget", type=float, default=1.0, help="Median import time in seconds"
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        elapsed, loaded = measure(module, args.runs)
+        status = "ok"
+        if elapsed > args.budget:
+            status = f"slower than budget of {args.budget:.3f}s"
+            failed = True
+        if loaded:
+            status = f"eagerly imports {', '.join(loaded)}"
+            failed = True
+        print(f"{module:<20} {elapsed * 1000:8.1f} ms  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmarks the preprocessing, the study tests and the tracing load on synthetic cohorts.
+
+    python benchmarks/run.py [--sizes 1000 10000 100000] [--save-baseline]
+
+Records wall time, throughput and peak memory (tracemalloc, allocations of worker processes are not included)
+of every benchmark to a JSON file and compares them with benchmarks/baseline.json if it exists.
+The figure cache of util is turned off, every timed run renders its figures like a first run.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Repeated runs would otherwise only measure hits of the figure cache
+os.environ["AZUBEE_FIGURE_CACHE"] = "0"
+
+import numpy as np
+import synthetic
+from aggregation import CohortAggregates
+from data_preparation import (
+    build_evaluation_frame,
+    build_task_mapping,
+    extract_data,
+    preprocess_evaluation,
+)
+from tracing import load_tracing
+from util import perform_test
+import main_study
+import pre_study
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+
+# Writing and parsing xlsx files is slow, larger cohorts only run the in-memory benchmarks
+MAX_XLSX_ROWS = 100_000
+
+
+def measure(func, repeat):
+    """
+    Best wall time of `repeat` runs and the peak of traced allocations of a separate run
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # tracemalloc slows down allocations, the peak is therefore measured within its own run
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(timings), peak
+
+
+def cases(rows, workspace, with_xlsx):
+    """
+    Yields (name, rows, callable) of every benchmark for the cohort size
+    """
+    frames = dict()
+    for study_name in synthetic.SKILLS:
+        pretest, posttest, exercises = synthetic.generate_study(study_name, rows)
+        frames[study_name] = build_evaluation_frame(
+            pretest,
+            posttest,
+            build_task_mapping(exercises),
+            synthetic.SKILLS[study_name],
+        )
+        if with_xlsx:
+            synthetic.write_workbook(
+                os.path.join(workspace, "data", f"{study_name}_evaluation.xlsx"),
+                pretest,
+                posttest,
+                exercises,
+            )
+
+        yield (
+            f"build_evaluation_frame[{study_name}]",
+            len(pretest),
+            lambda: build_evaluation_frame(
+                pretest,
+                posttest,
+                build_task_mapping(exercises),
+                synthetic.SKILLS[study_name],
+            ),
+        )
+
+        if with_xlsx:
+
+            def extract_uncached():
+                # Drop the parsed sheets so the workbook is parsed on every run
+                shutil.rmtree(os.path.join(workspace, "cache"), ignore_errors=True)
+                extract_data(study_name)
+
+            yield (f"extract_data[{study_name}]", len(pretest), extract_uncached)
+            yield (
+                f"preprocess_evaluation[{study_name}]",
+                len(pretest),
+                lambda: preprocess_evaluation(study_name, synthetic.SKILLS[study_name]),
+            )
+
+    main = frames["main"]
+    recommended = main_study.extract_entries(main, was_recommended=True)
+    unrecommended = main_study.extract_entries(main, was_recommended=False)
+
+    def main_tests():
+        # Fresh aggregates, the tests would otherwise only read the memoized results
+        recommended_aggregates = CohortAggregates(recommended)
+        unrecommended_aggregates = CohortAggregates(unrecommended)
+        for test in [
+            main_study.test_improvement_normalized_change_skills,
+            main_study.test_improvement_normalized_change_users,
+            main_study.test_reduced_recommendation_deviation_difference,
+        ]:
+            test(recommended_aggregates, unrecommended_aggregates, is_graph_norm=False)
+
+    yield "main_study tests", len(main), main_tests
+
+    pre = frames["pre"]
+    trained = pre_study.extract_entries(pre, was_trained=True)
+    untrained = pre_study.extract_entries(pre, was_trained=False)
+
+    def pre_tests():
+        pre_study.test_improvement_normalized_change_skill(
+            trained, untrained, is_graph_norm=True
+        )
+        pre_study.test_improvement_normalized_change_exercise(
+            trained, untrained, is_graph_norm=False
+        )
+
+    yield "pre_study tests", len(pre), pre_tests
+
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(0.3, 1, size=rows // 2), rng.normal(0, 1, size=rows // 2)
+    for is_related in (True, False):
+        yield (
+            f"perform_test[related={is_related}]",
+            rows,
+            lambda is_related=is_related: perform_test(
+                a, b, "a", "b", "Score", "benchmark", is_related, is_graph_norm=True
+            ),
+        )
+
+    tracing_path = os.path.join(workspace, "abzuege", "tracing.csv")
+    tracing = synthetic.generate_tracing(rows)
+    synthetic.write_tracing(tracing_path, tracing)
+    yield "load_tracing", len(tracing), lambda: load_tracing(tracing_path)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Benchmarks of the results which are slower than the baseline by more than the tolerance
+    """
+    previous = {(entry["name"], entry["rows"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        reference = previous.get((entry["name"], entry["rows"]))
+        if reference and entry["seconds"] > reference["seconds"] * (1 + tolerance):
+            regressions.append((entry, reference))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--resamples",
+        type=int,
+        default=1_000,
+        help="bootstrap and permutation resamples of the study tests (the studies use 100000)",
+    )
+    parser.add_argument("--output", default=RESULTS)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as regression",
+    )
+    args = parser.parse_args()
+
+    main_study.RESAMPLES = pre_study.RESAMPLES = args.resamples
+
+    results = []
+    cwd = os.getcwd()
+    for rows in args.sizes:
+        workspace = tempfile.mkdtemp(prefix="azubee-benchmark-")
+        for directory in ["data", "abzuege", "preprocessed", "img"]:
+            os.makedirs(os.path.join(workspace, directory))
+
+        # The study scripts read and write relative to the project directory
+        os.chdir(workspace)
+        try:
+            for name, size, func in cases(
+                rows, workspace, with_xlsx=rows <= MAX_XLSX_ROWS
+            ):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    seconds, peak = measure(func, args.repeat)
+                entry = {
+                    "name": name,
+                    "rows": size,
+                    "seconds": seconds,
+                    "rows_per_second": size / seconds,
+                    "peak_mb": peak / 2**20,
+                }
+                results.append(entry)
+                print(
+                    f"{name:<40} {size:>10} rows {seconds:10.4f} s "
+                    f"{entry['rows_per_second']:14.0f} rows/s {entry['peak_mb']:10.1f} MB"
+                )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for entry, reference in regressions:
+            print(
+                f"Regression: {entry['name']} ({entry['rows']} rows) took {entry['seconds']:.4f} s, "
+                f"baseline {reference['seconds']:.4f} s"
+            )
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Synthetic cohorts in the schemas of data/*_evaluation.xlsx and abzuege/tracing.csv.
+
+    python benchmarks/synthetic.py --rows 100000 --output-dir /tmp/synthetic
+"""
+
+import argparse
+import csv
+import os
+import uuid
+import numpy as np
+import pandas as pd
+
+SKILLS = {
+    "pre": [
+        "it-network-plan-vlan",
+        "it-network-plan-ipv4-static-routing",
+        "it-network-plan-vlan",
+        "it-network-plan-ipv4-static-routing",
+    ],
+    "main": [
+        "it-network-plan-vlan",
+        "it-network-plan-ipv4-static-routing",
+        "it-network-plan-ipv4-addressing",
+        "it-network-plan-vlan",
+        "it-network-plan-ipv4-static-routing",
+    ],
+}
+
+TRACING_SKILLS = [
+    "it-network-plan",
+    "it-network-plan-vlan",
+    "it-network-plan-ipv4-static-routing",
+    "it-network-plan-ipv4-addressing",
+]
+
+# Rows per sheet supported by xlsx (including the header)
+XLSX_MAX_ROWS = 1_048_575
+
+
+def generate_study(study_name, rows, seed=0):
+    """
+    Pretest, posttest and exercises sheets with roughly `rows` user x exercise entries
+    """
+    rng = np.random.default_rng(seed)
+    n_exercises = len(SKILLS[study_name])
+    n_users = max(2, rows // n_exercises)
+
+    exercises = pd.DataFrame(
+        {
+            "Test": np.repeat([1, 2], n_exercises),
+            "Exercise": np.tile(np.arange(1, n_exercises + 1), 2),
+            "Total": rng.integers(2, 11, size=2 * n_exercises),
+        }
+    )
+
+    users = np.repeat(np.arange(1, n_users + 1), n_exercises)
+    exercise = np.tile(np.arange(1, n_exercises + 1), n_users)
+    pre_total = exercises["Total"].to_numpy()[:n_exercises][exercise - 1]
+    post_total = exercises["Total"].to_numpy()[n_exercises:][exercise - 1]
+
+    # Posttest scores tend to be higher than the pretest scores
+    ability = rng.uniform(0, 1, size=len(users))
+    pretest = pd.DataFrame(
+        {
+            "User": users,
+            "Exercise": exercise,
+            "Correct": rng.binomial(pre_total, ability),
+        }
+    )
+    posttest = pd.DataFrame(
+        {
+            "User": users,
+            "Exercise": exercise,
+            "Correct": rng.binomial(post_total, np.minimum(ability + 0.1, 1)),
+        }
+    )
+
+    return pretest, posttest, exercises
+
+
+def write_workbook(path, pretest, posttest, exercises):
+    if len(pretest) > XLSX_MAX_ROWS:
+        raise ValueError(
+            f"{len(pretest)} rows exceed the xlsx limit of {XLSX_MAX_ROWS}"
+        )
+
+    with pd.ExcelWriter(path) as writer:
+        pretest.to_excel(writer, sheet_name="pretest", index=False)
+        posttest.to_excel(writer, sheet_name="posttest", index=False)
+        exercises.to_excel(writer, sheet_name="exercises", index=False)
+
+
+def generate_tracing(rows, seed=0, days=14):
+    """
+    Tracing export with roughly `rows` entries, one entry per user, skill and day
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(1, rows // (len(TRACING_SKILLS) * days))
+    user_ids = np.array(
+        [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n_users)]
+    )
+
+    user = np.repeat(np.arange(n_users), len(TRACING_SKILLS) * days)
+    skill = np.tile(np.repeat(np.arange(len(TRACING_SKILLS)), days), n_users)
+    day = np.tile(np.arange(days), n_users * len(TRACING_SKILLS))
+
+    # Mastery follows a noisy learning curve per user and skill
+    rate = rng.uniform(0.05, 0.3, size=n_users * len(TRACING_SKILLS))
+    mastery = np.clip(
+        1
+        - np.exp(-rate[user * len(TRACING_SKILLS) + skill] * day)
+        + rng.normal(0, 0.05, size=len(user)),
+        0,
+        1,
+    )
+
+    return pd.DataFrame(
+        {
+            "Date": pd.Timestamp("2023-02-13") + pd.to_timedelta(day, unit="D"),
+            "UserId": user_ids[user],
+            "SkillId": np.asarray(TRACING_SKILLS)[skill],
+            "Mastery": mastery,
+        }
+    )
+
+
+def write_tracing(path, tracing):
+    tracing.assign(
+        Date=tracing["Date"].dt.strftime("%d.%m.%Y %H:%M:%S"),
+    ).to_csv(
+        path, index=False, quoting=csv.QUOTE_ALL, decimal=",", encoding="utf-8-sig"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(args.output_dir, "data"), exist_ok=True)
+    os.makedirs(os.path.join(args.output_dir, "abzuege"), exist_ok=True)
+
+    for study_name in SKILLS:
+        write_workbook(
+            os.path.join(args.output_dir, "data", f"{study_name}_evaluation.xlsx"),
+            *generate_study(study_name, args.rows, seed=args.seed),
+        )
+    write_tracing(
+        os.path.join(args.output_dir, "abzuege", "tracing.csv"),
+        generate_tracing(args.rows, seed=args.seed),
+    )
+
+
+if __name__ == "__main__":
+    main()
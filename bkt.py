@@ -0,0 +1,189 @@
+"""
+Bayesian Knowledge Tracing (Corbett & Anderson, 1995) fitted by expectation maximization over the tracing export.
+
+    python bkt.py [--threshold 0.5] [--workers 4]
+
+Every skill is fitted on the sequences of all users at once, the forward-backward passes operate on
+[sequences x time] arrays. The tracing export holds mastery estimates instead of graded responses, they are
+used as soft observations (the probability of a correct response) unless a threshold binarizes them.
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+from resampling import map_jobs
+from tracing import load_tracing
+
+OUTPUT_PATH = "results/bkt_parameters.csv"
+
+PARAMETERS = ["prior", "learn", "guess", "slip"]
+INITIAL_PARAMETERS = {"prior": 0.5, "learn": 0.1, "guess": 0.2, "slip": 0.1}
+
+# Parameters are kept away from 0 and 1, where the model degenerates
+EPSILON = 1e-6
+
+
+def observation_matrix(entries: pd.DataFrame, threshold=None):
+    """
+    Mastery of the entries of one skill as [users x time] matrix, each row holds the entries of a user in order of their Date.
+    Shorter sequences are padded with NaN. A threshold binarizes the mastery into correct (1) and incorrect (0) responses.
+    """
+    users = entries["UserId"].astype("category").cat.codes.to_numpy()
+    order = np.lexsort((entries["Date"].to_numpy(), users))
+    users = users[order]
+    mastery = entries["Mastery"].to_numpy(dtype=float)[order]
+    if threshold is not None:
+        mastery = (mastery >= threshold).astype(float)
+
+    # Position of every entry within the sequence of its user
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    lengths = np.diff(np.r_[starts, len(users)])
+    steps = np.arange(len(users)) - np.repeat(starts, lengths)
+
+    observations = np.full((len(starts), lengths.max(initial=0)), np.nan)
+    observations[np.repeat(np.arange(len(starts)), lengths), steps] = mastery
+    return observations
+
+
+def _emissions(observations, guess, slip):
+    # Likelihood of the observations given the unknown (0) and known (1) state, missing observations carry no evidence
+    observed = ~np.isnan(observations)
+    o = np.where(observed, observations, 0)
+    unknown = guess**o * (1 - guess) ** (1 - o)
+    known = (1 - slip) ** o * slip ** (1 - o)
+    return (
+        np.where(observed, unknown, 1),
+        np.where(observed, known, 1),
+    )
+
+
+def _expectation(observations, prior, learn, guess, slip):
+    """
+    Scaled forward-backward pass over all sequences.
+    Returns the posterior of the known state, the expected unknown -> known transitions and the log likelihood.
+    """
+    n, steps = observations.shape
+    e0, e1 = _emissions(observations, guess, slip)
+
+    # Forward pass, alpha holds the probability of the known state given the observations up to t
+    alpha = np.empty((n, steps))
+    scale = np.empty((n, steps))
+    known = prior
+    for t in range(steps):
+        p0, p1 = (1 - known) * e0[:, t], known * e1[:, t]
+        scale[:, t] = p0 + p1
+        alpha[:, t] = p1 / scale[:, t]
+        # Knowledge is never forgotten, unknown skills are learned with probability `learn`
+        known = alpha[:, t] + (1 - alpha[:, t]) * learn
+
+    # Backward pass, beta holds the scaled likelihood of the observations after t for both states
+    beta0 = np.ones((n, steps))
+    beta1 = np.ones((n, steps))
+    for t in range(steps - 2, -1, -1):
+        next0 = e0[:, t + 1] * beta0[:, t + 1] / scale[:, t + 1]
+        next1 = e1[:, t + 1] * beta1[:, t + 1] / scale[:, t + 1]
+        beta0[:, t] = (1 - learn) * next0 + learn * next1
+        beta1[:, t] = next1
+
+    posterior = alpha * beta1
+    # Expected unknown -> known transitions between t and t + 1
+    transitions = (1 - alpha[:, :-1]) * learn * e1[:, 1:] * beta1[:, 1:] / scale[:, 1:]
+    return posterior, transitions, np.log(scale).sum()
+
+
+@traced()
+def fit_bkt(observations, initial=None, max_iterations=200, tolerance=1e-6):
+    """
+    Fits prior, learn, guess and slip to the [sequences x time] observations by expectation maximization.
+    Stops early once the log likelihood improves by less than the tolerance.
+    Returns the parameters together with the log likelihood, the number of iterations and whether it converged.
+    """
+    observations = np.asarray(observations, dtype=float)
+    parameters = {**INITIAL_PARAMETERS, **(initial or dict())}
+    observed = ~np.isnan(observations)
+    o = np.where(observed, observations, 0)
+
+    # Transitions are only counted within a sequence, not into the padding after its last observation
+    last = observations.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+    within = np.arange(1, observations.shape[1]) <= last[:, np.newaxis]
+
+    log_likelihood = -np.inf
+    converged = False
+    for iteration in range(1, max_iterations + 1):
+        posterior, transitions, current = _expectation(observations, **parameters)
+        # The log likelihood belongs to the parameters before the maximization, these are returned on convergence
+        improvement = current - log_likelihood
+        log_likelihood = current
+        if improvement < tolerance:
+            converged = True
+            break
+
+        unknown = 1 - posterior
+        parameters = {
+            "prior": posterior[:, 0].mean(),
+            "learn": (transitions * within).sum() / (unknown[:, :-1] * within).sum(),
+            "guess": (unknown * o * observed).sum() / (unknown * observed).sum(),
+            "slip": (posterior * (1 - o) * observed).sum()
+            / (posterior * observed).sum(),
+        }
+        parameters = {
+            name: float(np.clip(np.nan_to_num(value, nan=0.5), EPSILON, 1 - EPSILON))
+            for name, value in parameters.items()
+        }
+    else:
+        # The parameters of the last maximization are evaluated once more
+        log_likelihood = _expectation(observations, **parameters)[2]
+
+    return {
+        **parameters,
+        "log_likelihood": float(log_likelihood),
+        "iterations": iteration,
+        "converged": converged,
+    }
+
+
+def _fit_skill(skill_id, observations, options):
+    return skill_id, fit_bkt(observations, **options)
+
+
+@traced()
+def fit_skills(data: pd.DataFrame, threshold=None, max_workers=None, **options):
+    """
+    Fits a BKT model for every skill of the tracing data, the skills are fitted in parallel processes.
+    Returns one row of parameters per SkillId.
+    """
+    jobs = [
+        (skill_id, observation_matrix(entries, threshold), options)
+        for skill_id, entries in data.groupby("SkillId", observed=True, sort=True)
+    ]
+    results = map_jobs(_fit_skill, jobs, max_workers)
+
+    table = pd.DataFrame(
+        [{"SkillId": skill_id, **fitted} for skill_id, fitted in results],
+        columns=["SkillId", *PARAMETERS, "log_likelihood", "iterations", "converged"],
+    )
+    table["sequences"] = [len(observations) for _, observations, _ in jobs]
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="binarize the mastery into correct and incorrect responses",
+    )
+    parser.add_argument("--workers", type=int, help="processes fitting the skills")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    table = fit_skills(
+        load_tracing(), threshold=args.threshold, max_workers=args.workers
+    )
+    table.to_csv(args.output, index=None)
+    print(table.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
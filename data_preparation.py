@@ -1,10 +1,34 @@
+import argparse
+import os
+import shutil
+import numpy as np
 import pandas as pd
+from instrumentation import traced
+from sheet_cache import read_sheets, read_workbooks
 from util import (
+    render_queue,
     render_comparison_histogram,
     render_comparison_histograms,
     normalize_scores,
 )
 
+PREPROCESSED_DIR = "preprocessed"
+
+SHEETS = ["pretest", "posttest", "exercises"]
+
+# Compact schema of the preprocessed entries, the skills are categorical with sorted categories.
+# The scores stay float64: rounding them changes which means of the studies tie, and with it their p-values.
+PREPROCESSED_DTYPES = {
+    "User": "int32",
+    "Exercise": "int16",
+    "PretestCorrect": "int16",
+    "PosttestCorrect": "int16",
+    "ExerciseSkill": "category",
+    "PretestCorrectRel": "float64",
+    "PosttestCorrectRel": "float64",
+    "NormalizedChange": "float64",
+}
+
 
 # Hake, R. R. (1998).
 # https://doi.org/10.1119/1.18809
@@ -22,38 +46,125 @@ def normalized_change(pretest, posttest):
     """
     Function to calculate the normalized change
     The pretest and posttest scores are to be provided as percentages (e.g. 40 for 40%)
+    Accepts scalars as well as arrays, in which case the change is computed element-wise
     """
-    assert 0 <= pretest <= 100
-    assert 0 <= posttest <= 100
-    if posttest > pretest:
-        return (posttest - pretest) / (100 - pretest)
-    elif posttest < pretest:
-        return (posttest - pretest) / (pretest)
-    else:
-        # "In the [perfect score] case we argue that this student’s scores should be removed from the data sets because the student’s performance is beyond the scope of the measurement instrument"
-        # => We do not drop the student
-        return 0
+    pretest = np.asarray(pretest, dtype=float)
+    posttest = np.asarray(posttest, dtype=float)
+    assert np.all((0 <= pretest) & (pretest <= 100))
+    assert np.all((0 <= posttest) & (posttest <= 100))
+
+    up = posttest > pretest
+    down = posttest < pretest
+    diff = posttest - pretest
+
+    # "In the [perfect score] case we argue that this student’s scores should be removed from the data sets because the student’s performance is beyond the scope of the measurement instrument"
+    # => We do not drop the student, equal scores result in a change of 0
+    change = np.zeros(np.broadcast(pretest, posttest).shape)
+    np.divide(diff, 100 - pretest, out=change, where=up)
+    np.divide(diff, pretest, out=change, where=down)
+
+    if change.ndim == 0:
+        return change.item()
+    return change
 
 
 def build_task_mapping(exercises: pd.DataFrame):
-    mapping = dict()
+    """
+    Maps (Test, Exercise) to the maximum points of the exercise
+    """
+    return (
+        exercises.astype({"Test": int, "Exercise": int, "Total": int})
+        .set_index(["Test", "Exercise"])["Total"]
+        .sort_index()
+    )
+
+
+def assert_in_range(data: pd.DataFrame, column: str, low=0, high=100):
+    invalid = ~data[column].between(low, high)
+    assert not invalid.any(), (
+        f"{column} outside of [{low}, {high}] for rows:\n{data.loc[invalid]}"
+    )
+
+
+def compact_frame(data: pd.DataFrame):
+    """
+    Converts the preprocessed entries (or a subset of their columns) to PREPROCESSED_DTYPES
+    """
+    data = data.astype(
+        {
+            column: dtype
+            for column, dtype in PREPROCESSED_DTYPES.items()
+            if column in data
+        }
+    )
+    if "ExerciseSkill" in data:
+        skills = data["ExerciseSkill"].cat
+        data["ExerciseSkill"] = skills.set_categories(sorted(skills.categories))
+    return data
+
 
-    for _, row in exercises.iterrows():
-        test = int(row["Test"])
-        exercise = int(row["Exercise"])
-        total = int(row["Total"])
+def write_preprocessed(
+    data: pd.DataFrame, study_name: str, output_dir=PREPROCESSED_DIR, export_csv=False
+):
+    """
+    Writes the entries as parquet dataset {output_dir}/{study_name}/ExerciseSkill=<skill>/part-0.parquet.
+    export_csv additionally writes {output_dir}/{study_name}_preprocessed.csv to be read by humans.
+    """
+    path = os.path.join(output_dir, study_name)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for skill, entries in data.groupby("ExerciseSkill", observed=True):
+        partition = os.path.join(tmp_path, f"ExerciseSkill={skill}")
+        os.makedirs(partition)
+        entries.drop(columns="ExerciseSkill").to_parquet(
+            os.path.join(partition, "part-0.parquet"), index=False
+        )
 
-        mapping.setdefault(test, dict())
-        mapping[test][exercise] = total
+    # The dataset is replaced as a whole, partitions of skills that no longer occur are removed
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
 
-    return mapping
+    if export_csv:
+        data.to_csv(
+            os.path.join(output_dir, f"{study_name}_preprocessed.csv"), index=None
+        )
+
+
+def read_preprocessed(
+    study_name: str, columns=None, skills=None, input_dir=PREPROCESSED_DIR
+):
+    """
+    Loads the entries written by write_preprocessed, sorted by User and Exercise.
+    Only the given columns (User and Exercise are always loaded) and the partitions of the given skills are read,
+    the parquet files are memory-mapped.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(["User", "Exercise", *columns]))
+    data = pd.read_parquet(
+        os.path.join(input_dir, study_name),
+        columns=columns,
+        filters=[("ExerciseSkill", "in", list(skills))] if skills else None,
+        memory_map=True,
+    )
+    # The partition column is read last, the columns are restored to the order of the schema
+    data = data[[column for column in PREPROCESSED_DTYPES if column in data]]
+    return compact_frame(data).sort_values(
+        ["User", "Exercise"], kind="stable", ignore_index=True
+    )
 
 
+def workbook_path(study_name: str):
+    return f"data/{study_name}_evaluation.xlsx"
+
+
+@traced()
 def extract_data(study_name: str):
-    xlsx = pd.ExcelFile(f"data/{study_name}_evaluation.xlsx")
+    sheets = read_sheets(workbook_path(study_name), SHEETS)
 
-    raw_pretest = pd.read_excel(xlsx, "pretest")
-    raw_posttest = pd.read_excel(xlsx, "posttest")
+    raw_pretest = sheets["pretest"]
+    raw_posttest = sheets["posttest"]
 
     if study_name == "pre":
         pretest = raw_pretest
@@ -65,13 +176,24 @@ def extract_data(study_name: str):
     else:
         raise ValueError(study_name)
 
-    exercises = pd.read_excel(xlsx, "exercises")
-    mapping = build_task_mapping(exercises)
+    mapping = build_task_mapping(sheets["exercises"])
     return pretest, posttest, mapping
 
 
-def preprocess_evaluation(study_name, skills):
-    pretest, posttest, mapping = extract_data(study_name)
+def max_points(mapping: pd.Series, test: int, exercises: pd.Series):
+    """
+    Looks up the maximum points of the given exercises within the test
+    """
+    totals = mapping.loc[test].reindex(exercises.to_numpy())
+    assert totals.notna().all(), (
+        f"Missing maximum points for test {test}, exercises: "
+        f"{sorted(set(exercises[totals.isna().to_numpy()]))}"
+    )
+    return totals.to_numpy()
+
+
+@traced()
+def build_evaluation_frame(pretest, posttest, mapping, skills):
     data = pd.DataFrame()
 
     data["User"] = posttest["User"]
@@ -80,28 +202,34 @@ def preprocess_evaluation(study_name, skills):
     data["PretestCorrect"] = pretest["Correct"]
     data["PosttestCorrect"] = posttest["Correct"]
 
-    for index, row in data.iterrows():
-        exercise = int(row["Exercise"])
-        data.at[index, "ExerciseSkill"] = skills[exercise - 1]
-
-        # A) Relative Correctness of the exercise within the initial test
-        pre_max_points = mapping[1][exercise]
-        rel_pre_correct = row["PretestCorrect"] / pre_max_points * 100
-        assert rel_pre_correct >= 0
-        assert rel_pre_correct <= 100
-        data.at[index, "PretestCorrectRel"] = rel_pre_correct
-
-        # B) Relative Correctness of the exercise within the post test
-        post_max_points = mapping[2][exercise]
-        rel_post_correct = row["PosttestCorrect"] / post_max_points * 100
-        assert rel_post_correct >= 0
-        assert rel_post_correct <= 100
-        data.at[index, "PosttestCorrectRel"] = rel_post_correct
-
-        # C) Normalized Change
-        data.at[index, "NormalizedChange"] = normalized_change(
-            pretest=rel_pre_correct, posttest=rel_post_correct
-        )
+    exercises = data["Exercise"].astype(int)
+    data["ExerciseSkill"] = np.asarray(skills)[exercises.to_numpy() - 1]
+
+    # A) Relative Correctness of the exercise within the initial test
+    data["PretestCorrectRel"] = (
+        data["PretestCorrect"] / max_points(mapping, 1, exercises) * 100
+    )
+    assert_in_range(data, "PretestCorrectRel")
+
+    # B) Relative Correctness of the exercise within the post test
+    data["PosttestCorrectRel"] = (
+        data["PosttestCorrect"] / max_points(mapping, 2, exercises) * 100
+    )
+    assert_in_range(data, "PosttestCorrectRel")
+
+    # C) Normalized Change
+    data["NormalizedChange"] = normalized_change(
+        pretest=data["PretestCorrectRel"].to_numpy(),
+        posttest=data["PosttestCorrectRel"].to_numpy(),
+    )
+
+    return compact_frame(data)
+
+
+@traced()
+def preprocess_evaluation(study_name, skills, export_csv=False):
+    pretest, posttest, mapping = extract_data(study_name)
+    data = build_evaluation_frame(pretest, posttest, mapping, skills)
 
     # Plot Some Histograms
 
@@ -219,29 +347,48 @@ def preprocess_evaluation(study_name, skills):
             output_dir=f"data/{study_name}/img",
         )
 
-    data.to_csv(f"preprocessed/{study_name}_preprocessed.csv", index=None)
+    write_preprocessed(data, study_name, export_csv=export_csv)
 
 
-# The pre test where the exercise skill ordering was :
-# vlan, routing, vlan, routing
-preprocess_evaluation(
-    "pre",
-    [
-        "it-network-plan-vlan",
-        "it-network-plan-ipv4-static-routing",
-        "it-network-plan-vlan",
-        "it-network-plan-ipv4-static-routing",
-    ],
-)
-# The pre test where the exercise skill ordering was :
-# vlan, routing, addressing, vlan, routing
-preprocess_evaluation(
-    "main",
-    [
-        "it-network-plan-vlan",
-        "it-network-plan-ipv4-static-routing",
-        "it-network-plan-ipv4-addressing",
-        "it-network-plan-vlan",
-        "it-network-plan-ipv4-static-routing",
-    ],
-)
+@traced("data_preparation")
+def main(export_csv=False):
+    with render_queue():
+        # Parses the sheets of both workbooks concurrently, the studies below read them from the cache
+        read_workbooks(
+            {workbook_path(study_name): SHEETS for study_name in ["pre", "main"]}
+        )
+        # The pre test where the exercise skill ordering was :
+        # vlan, routing, vlan, routing
+        preprocess_evaluation(
+            "pre",
+            [
+                "it-network-plan-vlan",
+                "it-network-plan-ipv4-static-routing",
+                "it-network-plan-vlan",
+                "it-network-plan-ipv4-static-routing",
+            ],
+            export_csv=export_csv,
+        )
+        # The pre test where the exercise skill ordering was :
+        # vlan, routing, addressing, vlan, routing
+        preprocess_evaluation(
+            "main",
+            [
+                "it-network-plan-vlan",
+                "it-network-plan-ipv4-static-routing",
+                "it-network-plan-ipv4-addressing",
+                "it-network-plan-vlan",
+                "it-network-plan-ipv4-static-routing",
+            ],
+            export_csv=export_csv,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="additionally export the preprocessed entries as CSV",
+    )
+    main(export_csv=parser.parse_args().csv)
@@ -0,0 +1,174 @@
+"""
+Effect sizes of two-sample comparisons, for a single pair of samples or for every group of long-format data.
+
+The grouped variants compute all groups within one pass of grouped counts, sums and sums of squares (and ranks
+for the rank-biserial correlation), no Python loop runs over the groups. Positive effect sizes mean that the
+first sample (a) is larger.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _pooled_std(n1, var1, n2, var2):
+    return np.sqrt(((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2))
+
+
+def _hedges_correction(df):
+    # Exact small sample correction J(df) = Γ(df/2) / (sqrt(df/2) Γ((df-1)/2)) of Hedges (1981)
+    from scipy.special import gammaln
+
+    df = np.asarray(df, dtype=float)
+    return np.exp(gammaln(df / 2) - gammaln((df - 1) / 2)) / np.sqrt(df / 2)
+
+
+def cohens_d(a, b):
+    """
+    Cohen's d with pooled standard deviation, same as util.calculate_cohends_d
+    """
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    pooled_std = _pooled_std(len(a), a.var(ddof=1), len(b), b.var(ddof=1))
+    return (a.mean() - b.mean()) / pooled_std
+
+
+def hedges_g(a, b):
+    """
+    Cohen's d corrected for its bias in small samples
+    """
+    return cohens_d(a, b) * _hedges_correction(len(a) + len(b) - 2)
+
+
+def cohens_dz(a, b):
+    """
+    Standardized mean difference of related samples (mean of the differences over their standard deviation)
+    """
+    diff = np.asarray(a, dtype=float) - np.asarray(b, dtype=float)
+    return diff.mean() / diff.std(ddof=1)
+
+
+def rank_biserial(a, b, is_related):
+    """
+    Rank-biserial correlation matching the Mann-Whitney U test (2 U / (n1 n2) - 1), or for related samples
+    the Wilcoxon signed-rank test ((R+ - R-) / (R+ + R-), zero differences are ranked but not counted as with zero_method="pratt")
+    """
+    from scipy.stats import rankdata
+
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if is_related:
+        diff = a - b
+        ranks = rankdata(np.abs(diff))
+        r_plus, r_minus = ranks[diff > 0].sum(), ranks[diff < 0].sum()
+        return (r_plus - r_minus) / (r_plus + r_minus)
+
+    ranks = rankdata(np.concatenate([a, b]))
+    u1 = ranks[: len(a)].sum() - len(a) * (len(a) + 1) / 2
+    return 2 * u1 / (len(a) * len(b)) - 1
+
+
+def comparison_effect_sizes(a, b, is_related):
+    """
+    Effect sizes reported by the studies next to Cohen's d: Hedges' g, d_z (NaN for independent samples)
+    and the rank-biserial correlation matching the rank test of the design
+    """
+    return {
+        "hedges_g": hedges_g(a, b),
+        "cohens_dz": cohens_dz(a, b) if is_related else np.nan,
+        "rank_biserial": rank_biserial(a, b, is_related),
+    }
+
+
+def _moments(values, keys):
+    # Count, mean and variance per group from grouped sums, values are centered first so that the sums
+    # of squares do not lose precision to large means
+    center = values.mean()
+    centered = values - center
+    grouped = pd.DataFrame({"x": centered, "x2": centered**2}).groupby(
+        keys, observed=True, sort=True
+    )
+    n = grouped["x"].count()
+    total = grouped["x"].sum()
+    squares = grouped["x2"].sum()
+    mean = total / n
+    var = (squares - total * mean) / (n - 1)
+    return n, mean + center, var
+
+
+def effect_sizes(df, by, group, value, a, b, pair=None):
+    """
+    Effect sizes of the `value` entries where `group` equals `a` compared with the ones where it equals `b`,
+    for every group of the `by` columns (the grouping of batch_testing.perform_tests).
+    Related samples are aligned by the `pair` column (e.g. User, repeated entries are averaged), which adds
+    the paired d_z and turns the rank-biserial correlation into its matched-pairs version.
+    Returns one row per group with n_a, n_b, mean_a, mean_b, cohens_d, hedges_g, (cohens_dz) and rank_biserial.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+
+    if pair is not None:
+        paired = (
+            df.loc[df[group].isin([a, b])]
+            .pivot_table(
+                index=[*by, pair],
+                columns=group,
+                values=value,
+                aggfunc="mean",
+                observed=True,
+            )
+            .reindex(columns=[a, b])
+            .dropna()
+        )
+        long = pd.concat(
+            [
+                paired[a].rename(value).reset_index().assign(**{group: a}),
+                paired[b].rename(value).reset_index().assign(**{group: b}),
+            ],
+            ignore_index=True,
+        )
+    else:
+        long = df.loc[df[group].isin([a, b]) & df[value].notna(), [*by, group, value]]
+
+    values = long[value].astype(float)
+    n, mean, var = _moments(values, [long[column] for column in [*by, group]])
+    n, mean, var = (
+        frame.unstack(group).reindex(columns=[a, b]) for frame in (n, mean, var)
+    )
+    table = pd.DataFrame(
+        {
+            "n_a": n[a],
+            "n_b": n[b],
+            "mean_a": mean[a],
+            "mean_b": mean[b],
+        }
+    )
+
+    n_a, n_b = table["n_a"].to_numpy(float), table["n_b"].to_numpy(float)
+    pooled_std = _pooled_std(n_a, var[a].to_numpy(), n_b, var[b].to_numpy())
+    table["cohens_d"] = (table["mean_a"] - table["mean_b"]) / pooled_std
+    with np.errstate(invalid="ignore"):
+        table["hedges_g"] = table["cohens_d"] * _hedges_correction(n_a + n_b - 2)
+
+    if pair is not None:
+        diff = paired[a] - paired[b]
+        _, diff_mean, diff_var = _moments(
+            diff, [diff.index.get_level_values(column) for column in by]
+        )
+        table["cohens_dz"] = diff_mean / np.sqrt(diff_var)
+
+        # Ranks of the absolute differences within each group, zero differences count for neither side
+        ranks = diff.abs().groupby(level=by, observed=True).rank()
+        keys = [diff.index.get_level_values(column) for column in by]
+        r_plus = ranks.where(diff > 0, 0).groupby(keys, observed=True).sum()
+        r_minus = ranks.where(diff < 0, 0).groupby(keys, observed=True).sum()
+        table["rank_biserial"] = (r_plus - r_minus) / (r_plus + r_minus)
+    else:
+        ranks = values.groupby([long[column] for column in by], observed=True).rank()
+        rank_sum_a = (
+            ranks.where(long[group] == a, 0)
+            .groupby([long[column] for column in by], observed=True)
+            .sum()
+        )
+        u1 = rank_sum_a - table["n_a"] * (table["n_a"] + 1) / 2
+        table["rank_biserial"] = 2 * u1 / (table["n_a"] * table["n_b"]) - 1
+
+    # Groups without entries of one of the samples are left out
+    table = table.dropna(subset=["n_a", "n_b"])
+    return table.astype({"n_a": int, "n_b": int}).reset_index()
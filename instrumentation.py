@@ -0,0 +1,190 @@
+"""
+Opt-in timing and memory instrumentation of the evaluation.
+
+Spans record wall time, CPU time and the peak of traced allocations (tracemalloc) of a stage or function.
+Instrumentation is off by default and adds one flag check per instrumented call while off.
+Enable it with enable() or by setting the AZUBEE_TRACE environment variable to the path of a
+Chrome trace file, which is written when the process exits. Spans are recorded per process, the
+workers of the render queue return their spans to the parent (export_spans, merge_spans). Work of
+other process pools is only covered by the span of the function that started it.
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_enabled = False
+_trace_memory = False
+_spans = []
+_stack = threading.local()
+_origin = time.perf_counter()
+
+# Shared no-op context of disabled spans
+_disabled_span = nullcontext()
+
+
+def enable(trace_memory=True):
+    """
+    Starts recording spans, trace_memory additionally records the peak allocation of each span (slower)
+    """
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def is_tracing_memory():
+    return _trace_memory
+
+
+def reset():
+    _spans.clear()
+
+
+def spans():
+    """
+    The recorded spans in the order they finished
+    """
+    return list(_spans)
+
+
+@contextmanager
+def _record(name, attributes):
+    stack = _stack.__dict__.setdefault("spans", [])
+    entry = {"name": name, "depth": len(stack), **attributes}
+
+    if _trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        # tracemalloc keeps a single peak, the enclosing span keeps the peak reached so far
+        if stack:
+            stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+        tracemalloc.reset_peak()
+        entry["_start_memory"] = current
+        entry["_peak"] = current
+
+    stack.append(entry)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        stack.pop()
+
+        entry["start"] = start - _origin
+        entry["wall"] = wall
+        entry["cpu"] = cpu
+        entry["pid"] = os.getpid()
+        entry["tid"] = threading.get_ident()
+
+        if _trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(entry.pop("_peak"), peak)
+            entry["peak_alloc"] = peak - entry.pop("_start_memory")
+            if stack:
+                stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+
+        _spans.append(entry)
+
+
+def span(name, **attributes):
+    """
+    Context manager recording the enclosed block as a span, e.g. `with span("load"): ...`
+    """
+    if not _enabled:
+        return _disabled_span
+    return _record(name, attributes)
+
+
+def traced(name=None):
+    """
+    Decorator recording every call of the function as a span, named after the function by default
+    """
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _record(span_name, dict()):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def export_spans():
+    """
+    The recorded spans with their start on the clock of time.perf_counter, which is shared by all processes
+    """
+    return [{**entry, "start": entry["start"] + _origin} for entry in _spans]
+
+
+def merge_spans(entries):
+    """
+    Records the spans exported by another process (export_spans), e.g. a worker of a process pool
+    """
+    _spans.extend({**entry, "start": entry["start"] - _origin} for entry in entries)
+
+
+def export_json(path):
+    with open(path, "w") as file:
+        json.dump({"spans": spans()}, file, indent=2)
+
+
+def export_chrome_trace(path):
+    """
+    Writes the spans in the Chrome trace event format (chrome://tracing, Perfetto)
+    """
+    events = []
+    for entry in _spans:
+        args = {
+            key: value
+            for key, value in entry.items()
+            if key not in {"name", "start", "wall", "pid", "tid", "depth"}
+        }
+        events.append(
+            {
+                "name": entry["name"],
+                "ph": "X",
+                "ts": entry["start"] * 1e6,
+                "dur": entry["wall"] * 1e6,
+                "pid": entry["pid"],
+                "tid": entry["tid"],
+                "args": args,
+            }
+        )
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+if os.environ.get("AZUBEE_TRACE"):
+    enable()
+    _export_pid = os.getpid()
+
+    @atexit.register
+    def _export_at_exit():
+        # Forked worker processes inherit the handler, only the process that enabled tracing exports
+        if os.getpid() == _export_pid:
+            export_chrome_trace(os.environ["AZUBEE_TRACE"])
@@ -1,42 +1,197 @@
-import matplotlib.pyplot as plt
+import argparse
+import os
+import matplotlib
+import numpy as np
 import matplotlib.dates as mdates
-import pandas as pd
+from tracing import load_tracing, MasteryStore
 
 SKILL_ID = "it-network-plan"
 
-# Load CSV
-df = pd.read_csv('abzuege/tracing.csv')
+# User shown when no batch is requested
+USER_ID = "afe3ee14-2243-4133-83b5-4f7ff6aafd78"
 
-# Convert "Mastery" to floating point numbers
-df['Mastery'] = df['Mastery'].str.replace(',', '.').astype(float)
+OUTPUT_DIR = "img/mastery"
 
-# Convert "Date" to datetime
-df['Date'] = pd.to_datetime(df['Date'], format='%d.%m.%Y %H:%M:%S')
 
-# Sort the dataframe by 'Date'
-df = df.sort_values('Date')
+def plot_user_progress(ax, user_id, entries):
+    """
+    Plots the mastery over time for every skill of the user, entries are sorted by SkillId and Date
+    """
+    for skill, df_skill in entries.groupby("SkillId", observed=True, sort=True):
+        ax.plot(df_skill["Date"], df_skill["Mastery"], label=skill)
 
-# Select a user
-user_id = 'afe3ee14-2243-4133-83b5-4f7ff6aafd78'
+    # Set the date format
+    date_format = mdates.DateFormatter("%d.%m.%Y")
+    ax.xaxis.set_major_formatter(date_format)
 
-# Filter the dataframe for the selected user
-df_user = df[df['UserId'] == user_id]
+    # Set the date interval
+    ax.xaxis.set_major_locator(mdates.DayLocator())
 
-# Plot mastery over time
-fig, ax = plt.subplots(figsize=(10, 6))
-for skill in df_user['SkillId'].unique():
-    df_skill = df_user[df_user['SkillId'] == skill]
-    ax.plot(df_skill['Date'], df_skill['Mastery'], label=skill)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Mastery")
+    ax.legend()
+    ax.set_title(f"Mastery Progress for User: {user_id}")
 
-# Set the date format
-date_format = mdates.DateFormatter('%d.%m.%Y')
-ax.xaxis.set_major_formatter(date_format)
 
-# Set the date interval
-ax.xaxis.set_major_locator(mdates.DayLocator())
+def show_user_progress(store, user_id):
+    import matplotlib.pyplot as plt
 
-plt.xlabel('Date')
-plt.ylabel('Mastery')
-plt.legend()
-plt.title(f'Mastery Progress for User: {user_id}')
-plt.show()
+    fig, ax = plt.subplots(figsize=(10, 6))
+    plot_user_progress(ax, user_id, store.user(user_id))
+    plt.show()
+
+
+def _init_render_worker():
+    # Charts are only written to files
+    matplotlib.use("Agg", force=True)
+
+
+def _render_user_progress(user_id, entries, output_dir):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    plot_user_progress(ax, user_id, entries)
+    path = os.path.join(output_dir, f"{user_id}.png")
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def render_all_users(store, output_dir=OUTPUT_DIR, user_ids=None, max_workers=None):
+    """
+    Writes the mastery progress chart of every user (or only the given users) to output_dir.
+    The charts are rendered headless within a process pool, returns the paths of the written files.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(output_dir, exist_ok=True)
+    user_ids = list(store.users if user_ids is None else user_ids)
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_render_worker
+    ) as pool:
+        futures = [
+            pool.submit(_render_user_progress, user_id, store.user(user_id), output_dir)
+            for user_id in user_ids
+        ]
+        return [future.result() for future in futures]
+
+
+def plot_cohort_bands(ax, bands, skill_id):
+    """
+    Plots the mean mastery of every cohort over time with the band between the lowest and highest quantile
+    """
+    entries = bands.loc[bands["SkillId"] == skill_id]
+    quantiles = [column for column in bands.columns if column.startswith("q")]
+    for cohort, df_cohort in entries.groupby("cohort", sort=True):
+        (line,) = ax.plot(df_cohort["Date"], df_cohort["mean"], label=cohort)
+        if quantiles:
+            ax.fill_between(
+                df_cohort["Date"],
+                df_cohort[quantiles[0]],
+                df_cohort[quantiles[-1]],
+                color=line.get_color(),
+                alpha=0.2,
+            )
+
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%d.%m.%Y"))
+    ax.xaxis.set_major_locator(mdates.DayLocator())
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Mastery")
+    ax.legend()
+    ax.set_title(f"Mastery Progress of the Cohorts: {skill_id}")
+
+
+def study_cohorts(path):
+    """
+    Maps the UserId of the tracing to the main study cohort, the CSV file at path maps every UserId to the User of the study
+    """
+    import pandas as pd
+    from main_study import is_recommended
+
+    users = pd.read_csv(path)
+    return pd.Series(
+        np.where(is_recommended(users["User"]), "Recommended", "Unrecommended"),
+        index=users["UserId"],
+    )
+
+
+def render_cohort_bands(
+    store, cohorts, output_dir=OUTPUT_DIR, freq="6h", method="step"
+):
+    """
+    Writes the cohort mastery chart of every skill to output_dir, the series are resampled every `freq`
+    """
+    import pandas as pd
+
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    os.makedirs(output_dir, exist_ok=True)
+    grid = pd.date_range(store.dates.min(), store.dates.max(), freq=freq)
+    bands = store.cohort_bands(grid, cohorts, method=method)
+
+    paths = []
+    for skill_id in store.skills:
+        fig, ax = plt.subplots(figsize=(10, 6))
+        plot_cohort_bands(ax, bands, skill_id)
+        path = os.path.join(output_dir, f"cohorts_{skill_id}.png")
+        fig.savefig(path)
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot the mastery progress of users")
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="write the chart of every user to the output directory",
+    )
+    parser.add_argument(
+        "--users", nargs="+", help="write the charts of the given users only"
+    )
+    parser.add_argument(
+        "--cohorts",
+        help="CSV mapping UserId to the User of the main study, writes the mean and quartiles of both cohorts per skill",
+    )
+    parser.add_argument(
+        "--freq", default="6h", help="time grid of the cohort charts, e.g. 1h"
+    )
+    parser.add_argument(
+        "--interpolation",
+        choices=["step", "linear"],
+        default="step",
+        help="resampling of the series onto the time grid",
+    )
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    # Load CSV (sorted by Date, Mastery parsed with the decimal comma)
+    store = MasteryStore(load_tracing())
+
+    if args.cohorts:
+        paths = render_cohort_bands(
+            store,
+            study_cohorts(args.cohorts),
+            output_dir=args.output_dir,
+            freq=args.freq,
+            method=args.interpolation,
+        )
+        print(f"Wrote {len(paths)} charts to {args.output_dir}")
+    elif args.all or args.users:
+        paths = render_all_users(
+            store,
+            output_dir=args.output_dir,
+            user_ids=args.users,
+            max_workers=args.workers,
+        )
+        print(f"Wrote {len(paths)} charts to {args.output_dir}")
+    else:
+        show_user_progress(store, USER_ID)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,31 @@
 import pandas as pd
 import numpy as np
 from util import (
+    render_queue,
     render_comparison_histogram,
     calculate_cohends_d,
     perform_test,
     plot_pre_post,
     render_boxplot,
 )
-from scipy.stats import levene, f
-import matplotlib.pyplot as plt
+from data_preparation import read_preprocessed
+from instrumentation import traced
+from resampling import resample_inference, resampling_pool
+from effect_sizes import comparison_effect_sizes
+from aggregation import CohortAggregates
+
+# Seed of the bootstrap confidence intervals and permutation tests, keeps the results reproducible
+RESAMPLING_SEED = 0
+RESAMPLES = 100_000
+
+# Columns of the preprocessed entries used by the tests (besides User and Exercise)
+COLUMNS = [
+    "ExerciseSkill",
+    "PretestCorrectRel",
+    "PosttestCorrectRel",
+    "NormalizedChange",
+]
 
-plt.legend()
 # Exercise 1 : it-network-plan-vlan
 # Exercise 2 : it-network-plan-ipv4-static-routing
 # Exercise 3 : it-network-plan-ipv4-addressing
@@ -18,76 +33,54 @@ plt.legend()
 # Exercise 5 : it-network-plan-ipv4-static-routing
 
 
-# Users 1,3,5,7,9,11 no recommendation
-# Users 2,4,6,8,10,12 recommendation
+# Users 1,3,5,7,9,11 recommendation
+# Users 2,4,6,8,10,12 no recommendation
+def is_recommended(user):
+    """
+    Cohort of the study users (scalar or Series) as split by extract_entries, the odd users were recommended skills.
+    All results of the study are computed with this split.
+    """
+    return user % 2 != 0
+
+
 def extract_entries(df: pd.DataFrame, was_recommended: bool):
+    recommended = is_recommended(df.User)
     if was_recommended:
-        eq = df.where(df.User % 2 != 0)
-    else:
-        eq = df.where(df.User % 2 == 0)
-
-    return eq[eq["User"].notna()]
+        return df.loc[recommended]
+    return df.loc[~recommended]
 
 
+@traced()
 def prepare_data():
-    data = pd.read_csv("preprocessed/main_preprocessed.csv")
+    data = read_preprocessed("main", columns=COLUMNS)
 
-    recommended = extract_entries(df=data, was_recommended=True)
-    unrecommended = extract_entries(df=data, was_recommended=False)
+    recommended = CohortAggregates(extract_entries(df=data, was_recommended=True))
+    unrecommended = CohortAggregates(extract_entries(df=data, was_recommended=False))
 
     return recommended, unrecommended
 
 
+@traced()
 def test_comparison_graphs(recommended, unrecommended):
-    recommended_pretest = (
-        recommended.groupby(["User", "ExerciseSkill"])
-        .mean()["PretestCorrectRel"]
-        .to_numpy()
-    )
-    recommended_posttest = (
-        recommended.groupby(["User", "ExerciseSkill"])
-        .mean()["PosttestCorrectRel"]
-        .to_numpy()
-    )
-    recommended_pre_std = (
-        recommended.groupby(["User", "ExerciseSkill"])
-        .mean()
-        .groupby(["User"])
-        .std()["PretestCorrectRel"]
-        .to_numpy()
-    )
-    recommended_post_std = (
-        recommended.groupby(["User", "ExerciseSkill"])
-        .mean()
-        .groupby(["User"])
-        .std()["PosttestCorrectRel"]
-        .to_numpy()
-    )
-
-    unrecommended_pretest = (
-        unrecommended.groupby(["User", "ExerciseSkill"])
-        .mean()["PretestCorrectRel"]
-        .to_numpy()
-    )
-    unrecommended_posttest = (
-        unrecommended.groupby(["User", "ExerciseSkill"])
-        .mean()["PosttestCorrectRel"]
-        .to_numpy()
-    )
-    unrecommended_pre_std = (
-        unrecommended.groupby(["User", "ExerciseSkill"])
-        .mean()
-        .groupby(["User"])
-        .std()["PretestCorrectRel"]
-        .to_numpy()
-    )
-    unrecommended_post_std = (
-        unrecommended.groupby(["User", "ExerciseSkill"])
-        .mean()
-        .groupby(["User"])
-        .std()["PosttestCorrectRel"]
-        .to_numpy()
-    )
+    recommended_pretest = recommended.user_skill_mean()["PretestCorrectRel"].to_numpy()
+    recommended_posttest = recommended.user_skill_mean()[
+        "PosttestCorrectRel"
+    ].to_numpy()
+    recommended_pre_std = recommended.user_skill_std()["PretestCorrectRel"].to_numpy()
+    recommended_post_std = recommended.user_skill_std()["PosttestCorrectRel"].to_numpy()
+
+    unrecommended_pretest = unrecommended.user_skill_mean()[
+        "PretestCorrectRel"
+    ].to_numpy()
+    unrecommended_posttest = unrecommended.user_skill_mean()[
+        "PosttestCorrectRel"
+    ].to_numpy()
+    unrecommended_pre_std = unrecommended.user_skill_std()[
+        "PretestCorrectRel"
+    ].to_numpy()
+    unrecommended_post_std = unrecommended.user_skill_std()[
+        "PosttestCorrectRel"
+    ].to_numpy()
 
     # Graphical Evaluation
     render_comparison_histogram(
@@ -128,24 +121,21 @@ def test_comparison_graphs(recommended, unrecommended):
     )
 
 
+@traced()
 def test_improvement_normalized_change_skills(
-    recommended, unrecommended, is_graph_norm, norm_val=0.05
+    recommended, unrecommended, is_graph_norm, norm_val=0.05, executor=None
 ):
     """
     Function to calculate if, and how significant the learning improvement for the group using the recommendation system was, relative to the group manually selecting trained skills.
     The is_graph_norm is an indicator, if both distributions within the improvement_normalized_change_skills.png file are a normal distribution.
     This decides the statistical test used for evaluation.
     """
-    recommended_improvements = (
-        recommended.groupby(["User", "ExerciseSkill"])
-        .mean()["NormalizedChange"]
-        .to_numpy()
-    )
-    unrecommended_improvements = (
-        unrecommended.groupby(["User", "ExerciseSkill"])
-        .mean()["NormalizedChange"]
-        .to_numpy()
-    )
+    recommended_improvements = recommended.user_skill_mean()[
+        "NormalizedChange"
+    ].to_numpy()
+    unrecommended_improvements = unrecommended.user_skill_mean()[
+        "NormalizedChange"
+    ].to_numpy()
 
     statistic, pvalue, test_name = perform_test(
         is_related=False,
@@ -167,29 +157,34 @@ def test_improvement_normalized_change_skills(
         pvalue,
         test_name,
         calculate_cohends_d(recommended_improvements, unrecommended_improvements),
+        resample_inference(
+            recommended_improvements,
+            unrecommended_improvements,
+            is_related=False,
+            alternative="greater",
+            n_resamples=RESAMPLES,
+            seed=RESAMPLING_SEED,
+            executor=executor,
+        ),
+        comparison_effect_sizes(
+            recommended_improvements, unrecommended_improvements, is_related=False
+        ),
     )
 
 
+@traced()
 def test_improvement_normalized_change_users(
-    recommended, unrecommended, is_graph_norm, norm_val=0.05
+    recommended, unrecommended, is_graph_norm, norm_val=0.05, executor=None
 ):
     """
     Function to calculate if, and how significant the learning improvement for the group using the recommendation system was, relative to the group manually selecting trained skills.
     The is_graph_norm is an indicator, if both distributions within the improvement_normalized_change_users.png file are a normal distribution.
     This decides the statistical test used for evaluation.
     """
-    recommended_improvements = (
-        recommended[["User", "NormalizedChange"]]
-        .groupby(["User"])
-        .mean()["NormalizedChange"]
-        .to_numpy()
-    )
-    unrecommended_improvements = (
-        unrecommended[["User", "NormalizedChange"]]
-        .groupby(["User"])
-        .mean()["NormalizedChange"]
-        .to_numpy()
-    )
+    recommended_improvements = recommended.user_mean()["NormalizedChange"].to_numpy()
+    unrecommended_improvements = unrecommended.user_mean()[
+        "NormalizedChange"
+    ].to_numpy()
 
     statistic, pvalue, test_name = perform_test(
         is_related=False,
@@ -211,11 +206,24 @@ def test_improvement_normalized_change_users(
         pvalue,
         test_name,
         calculate_cohends_d(recommended_improvements, unrecommended_improvements),
+        resample_inference(
+            recommended_improvements,
+            unrecommended_improvements,
+            is_related=False,
+            alternative="greater",
+            n_resamples=RESAMPLES,
+            seed=RESAMPLING_SEED,
+            executor=executor,
+        ),
+        comparison_effect_sizes(
+            recommended_improvements, unrecommended_improvements, is_related=False
+        ),
     )
 
 
+@traced()
 def test_reduced_recommendation_deviation_difference(
-    recommended, unrecommended, is_graph_norm, norm_val=0.05
+    recommended, unrecommended, is_graph_norm, norm_val=0.05, executor=None
 ):
     """
     Function to calculate if, and how significant the reduction of deviation within the skills for users for the group using the recommendation system was, relative to the group manually selecting trained skills.
@@ -223,46 +231,9 @@ def test_reduced_recommendation_deviation_difference(
     This decides the statistical test used for evaluation.
     """
 
-    ## Calculate the mean scores for the pre and post test for each user and skill
-    ## Flatten the data to have a single value for each user and skill
-    recommended_vals = (
-        recommended[["User", "ExerciseSkill", "PosttestCorrectRel"]]
-        .groupby(["User", "ExerciseSkill"])
-        .mean()
-        .reset_index()
-    )
-
-    unrecommended_vals = (
-        unrecommended[["User", "ExerciseSkill", "PosttestCorrectRel"]]
-        .groupby(["User", "ExerciseSkill"])
-        .mean()
-        .reset_index()
-    )
-
-    ## Calculate the Coefficient of Variation (CV) for each user
-    recommended_mean = (
-        recommended_vals[["User", "PosttestCorrectRel"]]
-        .groupby(["User"])
-        .mean()["PosttestCorrectRel"]
-    )
-    recommended_std = (
-        recommended_vals[["User", "PosttestCorrectRel"]]
-        .groupby(["User"])
-        .std()["PosttestCorrectRel"]
-    )
-    recommended_cv = (recommended_std / recommended_mean) * 100
-
-    unrecommended_mean = (
-        unrecommended_vals[["User", "PosttestCorrectRel"]]
-        .groupby(["User"])
-        .mean()["PosttestCorrectRel"]
-    )
-    unrecommended_std = (
-        unrecommended_vals[["User", "PosttestCorrectRel"]]
-        .groupby(["User"])
-        .std()["PosttestCorrectRel"]
-    )
-    unrecommended_cv = (unrecommended_std / unrecommended_mean) * 100
+    ## Calculate the Coefficient of Variation (CV) of the mean scores of each skill for each user
+    recommended_cv = recommended.user_skill_cv()["PosttestCorrectRel"]
+    unrecommended_cv = unrecommended.user_skill_cv()["PosttestCorrectRel"]
 
     statistic, pvalue, test_name = perform_test(
         is_related=False,
@@ -284,69 +255,138 @@ def test_reduced_recommendation_deviation_difference(
         pvalue,
         test_name,
         calculate_cohends_d(recommended_cv, unrecommended_cv),
+        resample_inference(
+            recommended_cv,
+            unrecommended_cv,
+            is_related=False,
+            alternative="less",
+            n_resamples=RESAMPLES,
+            seed=RESAMPLING_SEED,
+            executor=executor,
+        ),
+        comparison_effect_sizes(recommended_cv, unrecommended_cv, is_related=False),
     )
 
 
-recommended, unrecommended = prepare_data()
-test_comparison_graphs(recommended=recommended, unrecommended=unrecommended)
+@traced("main_study")
+def main():
+    with render_queue(), resampling_pool() as executor:
+        recommended, unrecommended = prepare_data()
+        test_comparison_graphs(recommended=recommended, unrecommended=unrecommended)
 
-(
-    normalized_skills_statistic,
-    normalized_skills_pvalue,
-    normalized_skills_test_name,
-    normalized_skills_cohens,
-) = test_improvement_normalized_change_skills(
-    recommended, unrecommended, is_graph_norm=False, norm_val=0.05
-)
-(
-    normalized_users_skills_statistic,
-    normalized_users_skills_pvalue,
-    normalized_users_skills_test_name,
-    normalized_users_cohens,
-) = test_improvement_normalized_change_users(
-    recommended, unrecommended, is_graph_norm=False, norm_val=0.05
-)
-reduced_statistic, reduced_pvalue, reduced_test_name, reduced_cohens = (
-    test_reduced_recommendation_deviation_difference(
-        recommended=recommended,
-        unrecommended=unrecommended,
-        is_graph_norm=False,
-        norm_val=0.05,
-    )
-)
-
-data = pd.DataFrame(
-    {
-        "type": [
-            "normalized_change_skills",
-            "normalized_change_user",
-            "reduced_deviation",
-        ],
-        "t": [
+        (
             normalized_skills_statistic,
-            normalized_users_skills_statistic,
-            reduced_statistic,
-        ],
-        "p": [
             normalized_skills_pvalue,
-            normalized_users_skills_pvalue,
-            reduced_pvalue,
-        ],
-        "cohens": [normalized_skills_cohens, normalized_users_cohens, reduced_cohens],
-        "test": [
             normalized_skills_test_name,
+            normalized_skills_cohens,
+            normalized_skills_inference,
+            normalized_skills_effects,
+        ) = test_improvement_normalized_change_skills(
+            recommended,
+            unrecommended,
+            is_graph_norm=False,
+            norm_val=0.05,
+            executor=executor,
+        )
+        (
+            normalized_users_skills_statistic,
+            normalized_users_skills_pvalue,
             normalized_users_skills_test_name,
+            normalized_users_cohens,
+            normalized_users_inference,
+            normalized_users_effects,
+        ) = test_improvement_normalized_change_users(
+            recommended,
+            unrecommended,
+            is_graph_norm=False,
+            norm_val=0.05,
+            executor=executor,
+        )
+        (
+            reduced_statistic,
+            reduced_pvalue,
             reduced_test_name,
-        ],
-    }
-)
-
-data.to_csv(f"results/main_evaluation.csv", index=None)
-
-render_boxplot(
-    recommended.groupby(["User", "ExerciseSkill"]).mean()["NormalizedChange"],
-    unrecommended.groupby(["User", "ExerciseSkill"]).mean()["NormalizedChange"],
-    "main_boxplot_normalized_change",
-    ["Recommended", "Unrecommended"],
-    title="Normalized Change",
-)
+            reduced_cohens,
+            reduced_inference,
+            reduced_effects,
+        ) = test_reduced_recommendation_deviation_difference(
+            recommended=recommended,
+            unrecommended=unrecommended,
+            is_graph_norm=False,
+            norm_val=0.05,
+            executor=executor,
+        )
+
+        data = pd.DataFrame(
+            {
+                "type": [
+                    "normalized_change_skills",
+                    "normalized_change_user",
+                    "reduced_deviation",
+                ],
+                "t": [
+                    normalized_skills_statistic,
+                    normalized_users_skills_statistic,
+                    reduced_statistic,
+                ],
+                "p": [
+                    normalized_skills_pvalue,
+                    normalized_users_skills_pvalue,
+                    reduced_pvalue,
+                ],
+                "cohens": [
+                    normalized_skills_cohens,
+                    normalized_users_cohens,
+                    reduced_cohens,
+                ],
+                "test": [
+                    normalized_skills_test_name,
+                    normalized_users_skills_test_name,
+                    reduced_test_name,
+                ],
+                "cohens_ci_low": [
+                    normalized_skills_inference["cohens_low"],
+                    normalized_users_inference["cohens_low"],
+                    reduced_inference["cohens_low"],
+                ],
+                "cohens_ci_high": [
+                    normalized_skills_inference["cohens_high"],
+                    normalized_users_inference["cohens_high"],
+                    reduced_inference["cohens_high"],
+                ],
+                "p_permutation": [
+                    normalized_skills_inference["p_permutation"],
+                    normalized_users_inference["p_permutation"],
+                    reduced_inference["p_permutation"],
+                ],
+                "hedges_g": [
+                    normalized_skills_effects["hedges_g"],
+                    normalized_users_effects["hedges_g"],
+                    reduced_effects["hedges_g"],
+                ],
+                "cohens_dz": [
+                    normalized_skills_effects["cohens_dz"],
+                    normalized_users_effects["cohens_dz"],
+                    reduced_effects["cohens_dz"],
+                ],
+                "rank_biserial": [
+                    normalized_skills_effects["rank_biserial"],
+                    normalized_users_effects["rank_biserial"],
+                    reduced_effects["rank_biserial"],
+                ],
+            }
+        )
+
+        data.to_csv(f"results/main_evaluation.csv", index=None)
+
+        render_boxplot(
+            recommended.user_skill_mean()["NormalizedChange"],
+            unrecommended.user_skill_mean()["NormalizedChange"],
+            "main_boxplot_normalized_change",
+            ["Recommended", "Unrecommended"],
+            title="Normalized Change",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Runs the evaluation stages in dependency order and skips stages whose inputs and code are unchanged.
+
+    python pipeline.py [stage ...] [--force]
+"""
+
+import argparse
+import ast
+import glob
+import hashlib
+import importlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = ".pipeline.json"
+
+
+@dataclass
+class Stage:
+    name: str
+    # Module whose main() runs the stage
+    module: str
+    inputs: list
+    outputs: list
+    depends_on: list = field(default_factory=list)
+
+
+STAGES = [
+    Stage(
+        name="data_preparation",
+        module="data_preparation",
+        inputs=["data/pre_evaluation.xlsx", "data/main_evaluation.xlsx"],
+        outputs=[
+            "preprocessed/pre/*/*.parquet",
+            "preprocessed/main/*/*.parquet",
+            "data/pre/img/*.png",
+            "data/main/img/*.png",
+        ],
+    ),
+    Stage(
+        name="pre_study",
+        module="pre_study",
+        inputs=["preprocessed/pre/*/*.parquet"],
+        outputs=[
+            "results/pre_evaluation.csv",
+            "pre/histograms/*.png",
+            "img/pre_boxplot_normalized_change.png",
+        ],
+        depends_on=["data_preparation"],
+    ),
+    Stage(
+        name="main_study",
+        module="main_study",
+        inputs=["preprocessed/main/*/*.parquet"],
+        outputs=[
+            "results/main_evaluation.csv",
+            "main/histograms/*.png",
+            "img/main_boxplot_normalized_change.png",
+        ],
+        depends_on=["data_preparation"],
+    ),
+]
+
+
+def _hash_file(sha, path):
+    sha.update(os.path.relpath(path, ROOT).encode())
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+
+
+def local_modules(module):
+    """
+    The module and every module of this project it imports (transitively)
+    """
+    found = set()
+    pending = [module]
+
+    while pending:
+        name = pending.pop()
+        path = os.path.join(ROOT, f"{name}.py")
+        if name in found or not os.path.exists(path):
+            continue
+        found.add(name)
+
+        with open(path) as file:
+            tree = ast.parse(file.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name.split(".")[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module.split(".")[0])
+
+    return sorted(found)
+
+
+def stage_digest(stage):
+    """
+    Content hash of the inputs and the code of the stage
+    """
+    sha = hashlib.sha256()
+    for pattern in stage.inputs:
+        paths = sorted(glob.glob(os.path.join(ROOT, pattern)))
+        if not paths:
+            raise FileNotFoundError(f"Missing input {pattern} of stage {stage.name}")
+        for path in paths:
+            _hash_file(sha, path)
+    for module in local_modules(stage.module):
+        _hash_file(sha, os.path.join(ROOT, f"{module}.py"))
+    return sha.hexdigest()
+
+
+def outputs_exist(stage):
+    return all(glob.glob(os.path.join(ROOT, pattern)) for pattern in stage.outputs)
+
+
+def _load_state():
+    path = os.path.join(ROOT, STATE_FILE)
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save_state(state):
+    path = os.path.join(ROOT, STATE_FILE)
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _run_stage(module):
+    os.chdir(ROOT)
+    importlib.import_module(module).main()
+
+
+def _select(stages, names):
+    """
+    The requested stages together with all stages they depend on
+    """
+    by_name = {stage.name: stage for stage in stages}
+    selected = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in by_name:
+            raise ValueError(f"Unknown stage {name}")
+        if name not in selected:
+            selected.add(name)
+            pending.extend(by_name[name].depends_on)
+    return [stage for stage in stages if stage.name in selected]
+
+
+def run(names=None, force=False, stages=STAGES, max_workers=None):
+    """
+    Runs the stages (all by default) in dependency order, independent stages run concurrently.
+    A stage is skipped if its outputs exist and the digest of its inputs and code matches the last run.
+    Returns a mapping of stage name to "ran" or "skipped".
+    """
+    stages = _select(stages, names) if names else list(stages)
+    state = _load_state()
+    status = dict()
+    # Future of every running stage mapped to its name and digest
+    running = dict()
+    selected = {stage.name for stage in stages}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while len(status) < len(stages):
+            progress = False
+            for stage in stages:
+                if stage.name in status or stage.name in {
+                    name for name, _ in running.values()
+                }:
+                    continue
+                if any(
+                    dependency not in status
+                    for dependency in stage.depends_on
+                    if dependency in selected
+                ):
+                    continue
+
+                progress = True
+                # Inputs are only hashed once the stages producing them are done
+                digest = stage_digest(stage)
+                if (
+                    not force
+                    and state.get(stage.name) == digest
+                    and outputs_exist(stage)
+                ):
+                    status[stage.name] = "skipped"
+                    print(f"[{stage.name}] up to date, skipped")
+                    continue
+
+                print(f"[{stage.name}] running")
+                running[pool.submit(_run_stage, stage.module)] = (stage.name, digest)
+
+            if not running:
+                if not progress:
+                    raise ValueError("The stages contain a dependency cycle.")
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, digest = running.pop(future)
+                # Raises the error of a failed stage, stages that finished before keep their state
+                future.result()
+                state[name] = digest
+                _save_state(state)
+                status[name] = "ran"
+                print(f"[{name}] done")
+
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "stages", nargs="*", help="stages to run, including their dependencies"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="run the stages even if up to date"
+    )
+    args = parser.parse_args()
+    run(args.stages, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
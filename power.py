@@ -0,0 +1,192 @@
+"""
+Monte Carlo power of the study tests for a grid of effect sizes and sample sizes.
+
+    python power.py [--effects 0 0.5 1 1.5 2] [--sizes 6 12 18 24] [--replicates 10000] [--related] [--workers 4]
+
+Every cell of the grid draws synthetic normalized changes of both samples and tests them with the test
+selection of util.perform_test (batch_testing.test_matrix). The replicates of a cell are drawn and tested as
+[replicates x users] arrays in chunks, the chunks of all cells are distributed across processes.
+Effect sizes are Cohen's d between independent cohorts, or d_z of the paired differences for related samples.
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+from resampling import chunk_sizes, map_jobs, seeded_jobs
+
+OUTPUT_PATH = "results/power.csv"
+
+EFFECTS = [0.0, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0, 2.5]
+SIZES = [6, 12, 18, 24, 36, 48]
+
+# Normalized change of the baseline cohort, close to the unrecommended users of the main study
+BASELINE_MEAN = 0.2
+BASELINE_STD = 0.25
+
+
+def normalized_changes(rng, size, n, effect, mean, std, is_related):
+    """
+    [size x n] normalized changes of both samples, drawn from normal distributions and clipped to the
+    range of the normalized change [-1, 1]. Sample a is shifted by `effect` standard deviations.
+    """
+    b = rng.normal(mean, std, size=(size, n))
+    if is_related:
+        a = b + rng.normal(effect * std, std, size=(size, n))
+    else:
+        a = rng.normal(mean + effect * std, std, size=(size, n))
+    return np.clip(a, -1, 1), np.clip(b, -1, 1)
+
+
+def _simulate_chunk(effect, n, options, seed, size):
+    from batch_testing import TEST_NAMES, test_matrix
+
+    a, b = normalized_changes(
+        np.random.default_rng(seed),
+        size,
+        n,
+        effect,
+        options["mean"],
+        options["std"],
+        options["is_related"],
+    )
+    tested = test_matrix(
+        a,
+        b,
+        is_related=options["is_related"],
+        is_graph_norm=options["is_graph_norm"],
+        norm_val=options["norm_val"],
+        alternative="greater",
+    )
+    significant = tested["p"] < options["alpha"]
+    rank_tests = tested["test"] == TEST_NAMES[(options["is_related"], False)]
+    return effect, n, size, np.count_nonzero(significant), np.count_nonzero(rank_tests)
+
+
+@traced()
+def simulate_power(
+    effects=EFFECTS,
+    sizes=SIZES,
+    is_related=False,
+    is_graph_norm=False,
+    replicates=10_000,
+    alpha=0.05,
+    norm_val=0.05,
+    mean=BASELINE_MEAN,
+    std=BASELINE_STD,
+    seed=0,
+    chunk_size=None,
+    max_workers=None,
+):
+    """
+    Share of replicates rejecting the null hypothesis (alternative="greater") for every effect size and
+    number of users per sample. Every cell gets its own child of the seed, which is split among its chunks
+    by resampling.seeded_jobs.
+    Returns one row per cell with the power, its Monte Carlo standard error and the share of rank tests.
+    """
+    options = {
+        "is_related": is_related,
+        "is_graph_norm": is_graph_norm,
+        "norm_val": norm_val,
+        "alpha": alpha,
+        "mean": mean,
+        "std": std,
+    }
+
+    cells = [(effect, n) for effect in effects for n in sizes]
+    cell_seeds = np.random.SeedSequence(seed).spawn(len(cells))
+    jobs = []
+    for (effect, n), cell_seed in zip(cells, cell_seeds):
+        chunks = chunk_sizes(replicates, 2 * n, chunk_size)
+        jobs.extend(seeded_jobs((effect, n, options), chunks, cell_seed))
+    results = map_jobs(_simulate_chunk, jobs, max_workers)
+
+    table = (
+        pd.DataFrame(
+            results,
+            columns=["effect", "n", "replicates", "significant", "rank_tests"],
+        )
+        .groupby(["effect", "n"], sort=True)
+        .sum()
+        .reset_index()
+    )
+    table["power"] = table["significant"] / table["replicates"]
+    table["power_se"] = np.sqrt(
+        table["power"] * (1 - table["power"]) / table["replicates"]
+    )
+    table["rank_share"] = table["rank_tests"] / table["replicates"]
+    return table[["effect", "n", "replicates", "power", "power_se", "rank_share"]]
+
+
+def required_sizes(table, target=0.8):
+    """
+    Smallest simulated number of users per sample reaching the target power for every effect size (NaN if none does)
+    """
+    reached = table.loc[table["power"] >= target]
+    return (
+        reached.groupby("effect")["n"]
+        .min()
+        .reindex(table["effect"].unique())
+        .rename("n_required")
+        .reset_index()
+    )
+
+
+def observed_effects(path="results/main_evaluation.csv"):
+    """
+    Absolute Cohen's d of the tests of the main study, in the direction of their alternative
+    """
+    return sorted(pd.read_csv(path)["cohens"].abs().round(2).unique())
+
+
+def main():
+    from util import render_power_curves
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--effects", type=float, nargs="+", default=EFFECTS)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--observed",
+        action="store_true",
+        help="add the effect sizes of results/main_evaluation.csv to the grid",
+    )
+    parser.add_argument("--replicates", type=int, default=10_000)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--related", action="store_true", help="paired samples")
+    parser.add_argument(
+        "--graph-norm",
+        action="store_true",
+        help="allow t-tests for samples passing the Shapiro-Wilk test",
+    )
+    parser.add_argument("--mean", type=float, default=BASELINE_MEAN)
+    parser.add_argument("--std", type=float, default=BASELINE_STD)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="processes running the simulations")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    effects = args.effects
+    if args.observed:
+        effects = sorted(set(effects) | set(observed_effects()))
+
+    table = simulate_power(
+        effects=effects,
+        sizes=args.sizes,
+        is_related=args.related,
+        is_graph_norm=args.graph_norm,
+        replicates=args.replicates,
+        alpha=args.alpha,
+        mean=args.mean,
+        std=args.std,
+        seed=args.seed,
+        max_workers=args.workers,
+    )
+    table.to_csv(args.output, index=None)
+    render_power_curves(table, "power_curves", alpha=args.alpha)
+
+    print(table.pivot(index="effect", columns="n", values="power").to_string())
+    print(required_sizes(table).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
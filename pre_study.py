@@ -1,5 +1,22 @@
 import pandas as pd
-from util import calculate_cohends_d, render_boxplot, perform_test, plot_pre_post
+from util import (
+    calculate_cohends_d,
+    render_boxplot,
+    perform_test,
+    plot_pre_post,
+    render_queue,
+)
+from data_preparation import read_preprocessed
+from instrumentation import traced
+from resampling import resample_inference, resampling_pool
+from effect_sizes import comparison_effect_sizes
+
+# Seed of the bootstrap confidence intervals and permutation tests, keeps the results reproducible
+RESAMPLING_SEED = 0
+RESAMPLES = 100_000
+
+# Columns of the preprocessed entries used by the tests (besides User and Exercise)
+COLUMNS = ["ExerciseSkill", "NormalizedChange"]
 
 # Exercise 1 : it-network-plan-vlan
 # Exercise 2 : it-network-plan-ipv4-static-routing
@@ -11,15 +28,13 @@ from util import calculate_cohends_d, render_boxplot, perform_test, plot_pre_pos
 # Users 2,4,6,8,10,12 it-network-plan-vlan
 def extract_entries(df: pd.DataFrame, was_trained: bool):
     if was_trained:
-        eq = df.where(df.User % 2 != df.Exercise % 2)
-    else:
-        eq = df.where(df.User % 2 == df.Exercise % 2)
-
-    return eq[eq["User"].notna()]
+        return df.loc[df.User % 2 != df.Exercise % 2]
+    return df.loc[df.User % 2 == df.Exercise % 2]
 
 
+@traced()
 def prepare_data():
-    data = pd.read_csv("preprocessed/pre_preprocessed.csv")
+    data = read_preprocessed("pre", columns=COLUMNS)
 
     trained = extract_entries(df=data, was_trained=True)
     not_trained = extract_entries(df=data, was_trained=False)
@@ -27,16 +42,17 @@ def prepare_data():
     return trained, not_trained
 
 
+@traced()
 def test_improvement_normalized_change_skill(
-    trained, untrained, is_graph_norm, norm_val=0.05
+    trained, untrained, is_graph_norm, norm_val=0.05, executor=None
 ):
     """
     Function to calculate if, and how significant the learning improvement for the trained **skills** in terms of normalized change was, relative to the untrained skills.
     The is_graph_norm is an indicator, if both distributions within the improvement_normalized_change_skills.png file are a normal distribution.
     This decides the statistical test used for evaluation.
     """
-    trained_grouped = trained.groupby(["User", "ExerciseSkill"])
-    untrained_grouped = untrained.groupby(["User", "ExerciseSkill"])
+    trained_grouped = trained.groupby(["User", "ExerciseSkill"], observed=True)
+    untrained_grouped = untrained.groupby(["User", "ExerciseSkill"], observed=True)
 
     trained_improvements = trained_grouped.mean()["NormalizedChange"].to_numpy()
     untrained_improvements = untrained_grouped.mean()["NormalizedChange"].to_numpy()
@@ -59,11 +75,23 @@ def test_improvement_normalized_change_skill(
         pvalue,
         test_name,
         calculate_cohends_d(trained_improvements, untrained_improvements),
+        resample_inference(
+            trained_improvements,
+            untrained_improvements,
+            is_related=True,
+            n_resamples=RESAMPLES,
+            seed=RESAMPLING_SEED,
+            executor=executor,
+        ),
+        comparison_effect_sizes(
+            trained_improvements, untrained_improvements, is_related=True
+        ),
     )
 
 
+@traced()
 def test_improvement_normalized_change_exercise(
-    trained, untrained, is_graph_norm, norm_val=0.05
+    trained, untrained, is_graph_norm, norm_val=0.05, executor=None
 ):
     """
     Function to calculate if, and how significant the learning improvement for the trained **exercises** in terms of normalized change was, relative to the untrained exercises.
@@ -83,7 +111,7 @@ def test_improvement_normalized_change_exercise(
         filename=f"improvement_normalized_change_exercises",
         is_graph_norm=is_graph_norm,
         norm_val=norm_val,
-        output_dir="pre/histograms/"
+        output_dir="pre/histograms/",
     )
 
     return (
@@ -91,55 +119,108 @@ def test_improvement_normalized_change_exercise(
         pvalue,
         test_name,
         calculate_cohends_d(trained_improvements, untrained_improvements),
+        resample_inference(
+            trained_improvements,
+            untrained_improvements,
+            is_related=True,
+            n_resamples=RESAMPLES,
+            seed=RESAMPLING_SEED,
+            executor=executor,
+        ),
+        comparison_effect_sizes(
+            trained_improvements, untrained_improvements, is_related=True
+        ),
     )
 
 
-trained, untrained = prepare_data()
+@traced("pre_study")
+def main():
+    with render_queue(), resampling_pool() as executor:
+        trained, untrained = prepare_data()
 
-normalized_statistic, normalized_pvalue, normalized_test_name, normalized_cohens = (
-    test_improvement_normalized_change_skill(
-        trained, untrained, is_graph_norm=True, norm_val=0.05
-    )
-)
-(
-    normalized_exercise_statistic,
-    normalized_exercise_pvalue,
-    normalized_exercise_test_name,
-    normalized_exercise_cohens,
-) = test_improvement_normalized_change_exercise(
-    trained, untrained, is_graph_norm=False, norm_val=0.05
-)
-
-data = pd.DataFrame(
-    {
-        "type": [
-            "normalized_change_skill",
-            "normalized_change_exercise",
-        ],
-        "t": [
+        (
             normalized_statistic,
-            normalized_exercise_statistic,
-        ],
-        "p": [
             normalized_pvalue,
-            normalized_exercise_pvalue,
-        ],
-        "cohens": [
-            normalized_cohens,
-            normalized_exercise_cohens,
-        ],
-        "test": [
             normalized_test_name,
+            normalized_cohens,
+            normalized_inference,
+            normalized_effects,
+        ) = test_improvement_normalized_change_skill(
+            trained, untrained, is_graph_norm=True, norm_val=0.05, executor=executor
+        )
+        (
+            normalized_exercise_statistic,
+            normalized_exercise_pvalue,
             normalized_exercise_test_name,
-        ],
-    }
-)
-data.to_csv(f"results/pre_evaluation.csv", index=None)
-
-render_boxplot(
-    trained.groupby(["User", "ExerciseSkill"]).mean()["NormalizedChange"],
-    untrained.groupby(["User", "ExerciseSkill"]).mean()["NormalizedChange"],
-    "pre_boxplot_normalized_change",
-    ["Trained (Faded) Skills", "Untrained (Unfaded) Skills"],
-    title="Normalized Learning Gain",
-)
+            normalized_exercise_cohens,
+            normalized_exercise_inference,
+            normalized_exercise_effects,
+        ) = test_improvement_normalized_change_exercise(
+            trained, untrained, is_graph_norm=False, norm_val=0.05, executor=executor
+        )
+
+        data = pd.DataFrame(
+            {
+                "type": [
+                    "normalized_change_skill",
+                    "normalized_change_exercise",
+                ],
+                "t": [
+                    normalized_statistic,
+                    normalized_exercise_statistic,
+                ],
+                "p": [
+                    normalized_pvalue,
+                    normalized_exercise_pvalue,
+                ],
+                "cohens": [
+                    normalized_cohens,
+                    normalized_exercise_cohens,
+                ],
+                "test": [
+                    normalized_test_name,
+                    normalized_exercise_test_name,
+                ],
+                "cohens_ci_low": [
+                    normalized_inference["cohens_low"],
+                    normalized_exercise_inference["cohens_low"],
+                ],
+                "cohens_ci_high": [
+                    normalized_inference["cohens_high"],
+                    normalized_exercise_inference["cohens_high"],
+                ],
+                "p_permutation": [
+                    normalized_inference["p_permutation"],
+                    normalized_exercise_inference["p_permutation"],
+                ],
+                "hedges_g": [
+                    normalized_effects["hedges_g"],
+                    normalized_exercise_effects["hedges_g"],
+                ],
+                "cohens_dz": [
+                    normalized_effects["cohens_dz"],
+                    normalized_exercise_effects["cohens_dz"],
+                ],
+                "rank_biserial": [
+                    normalized_effects["rank_biserial"],
+                    normalized_exercise_effects["rank_biserial"],
+                ],
+            }
+        )
+        data.to_csv(f"results/pre_evaluation.csv", index=None)
+
+        render_boxplot(
+            trained.groupby(["User", "ExerciseSkill"], observed=True).mean()[
+                "NormalizedChange"
+            ],
+            untrained.groupby(["User", "ExerciseSkill"], observed=True).mean()[
+                "NormalizedChange"
+            ],
+            "pre_boxplot_normalized_change",
+            ["Trained (Faded) Skills", "Untrained (Unfaded) Skills"],
+            title="Normalized Learning Gain",
+        )
+
+
+if __name__ == "__main__":
+    main()
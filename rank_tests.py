@@ -0,0 +1,189 @@
+"""
+Wilcoxon signed-rank and Mann-Whitney U tests with memoized exact null distributions.
+
+scipy computes the exact null distribution of both tests again on every call. Here the p-value of every
+possible statistic is tabulated once per sample size(s) and alternative, kept in memory and persisted to
+the cache directory, so further tests of the same shape only look up their p-values.
+The method is chosen here instead of by scipy's method="auto", whose rules differ between scipy versions:
+the exact distribution is used without ties or zeros for at most 50 pairs (Wilcoxon test) or one of the samples
+at most 8 entries (Mann-Whitney U test), all other tests are passed to scipy with method="asymptotic".
+"""
+
+import os
+import numpy as np
+from sheet_cache import CACHE_DIR
+
+# The tables do not depend on the data, they are kept next to the module wherever it is run from
+TABLE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), CACHE_DIR, "rank_tests"
+)
+
+# Largest samples tested with the exact distribution
+WILCOXON_EXACT_MAX = 50
+MANNWHITNEYU_EXACT_MAX = 8
+
+_tables = dict()
+
+
+def _wilcoxon_counts(n):
+    # Number of sign assignments of the ranks 1..n resulting in the rank sum r_plus = 0..n(n+1)/2
+    counts = np.zeros(n * (n + 1) // 2 + 1, dtype=object)
+    counts[0] = 1
+    for rank in range(1, n + 1):
+        counts[rank:] = counts[rank:] + counts[:-rank]
+    return counts
+
+
+def _mannwhitneyu_counts(n1, n2):
+    # Number of orderings of the samples resulting in U = 0..n1*n2, the coefficients of the
+    # Gaussian binomial coefficient prod_{i=1..n1} (1 - q^(n2+i)) / (1 - q^i)
+    n1, n2 = min(n1, n2), max(n1, n2)
+    counts = np.zeros(n1 * n2 + 1, dtype=object)
+    counts[0] = 1
+    for i in range(1, n1 + 1):
+        counts[n2 + i :] = counts[n2 + i :] - counts[: -(n2 + i)]
+        # Division by (1 - q^i) sums up the coefficients within each residue class modulo i
+        padded = np.zeros(-(-len(counts) // i) * i, dtype=object)
+        padded[: len(counts)] = counts
+        counts = np.cumsum(padded.reshape(-1, i), axis=0).ravel()[: len(counts)]
+    return counts
+
+
+def _pvalue_table(counts, alternative):
+    """
+    p-values of every statistic given the counts of its null distribution, large statistics support the greater alternative
+    """
+    total = int(counts.sum())
+    cdf = np.cumsum(counts)
+    sf = np.cumsum(counts[::-1])[::-1]
+    if alternative == "two-sided":
+        tail = np.minimum(np.minimum(2 * sf, 2 * cdf), total)
+    elif alternative == "greater":
+        tail = sf
+    else:
+        tail = cdf
+    # Integer division of the exact counts, the p-values are correctly rounded
+    return np.array([int(count) / total for count in tail])
+
+
+def _load_table(name, build, cache_dir):
+    if name in _tables:
+        return _tables[name]
+
+    path = os.path.join(cache_dir, f"{name}.npy") if cache_dir else None
+    if path and os.path.exists(path):
+        table = np.load(path)
+    else:
+        table = build()
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Concurrent processes may build the same table, each writes its own file before replacing
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                np.save(file, table)
+            os.replace(tmp_path, path)
+
+    _tables[name] = table
+    return table
+
+
+def wilcoxon_table(n, alternative, cache_dir=TABLE_DIR):
+    """
+    Exact p-values of the Wilcoxon signed-rank test of n pairs, indexed by the rank sum of the positive differences
+    """
+    return _load_table(
+        f"wilcoxon_{n}_{alternative}",
+        lambda: _pvalue_table(_wilcoxon_counts(n), alternative),
+        cache_dir,
+    )
+
+
+def mannwhitneyu_table(n1, n2, alternative, cache_dir=TABLE_DIR):
+    """
+    Exact p-values of the Mann-Whitney U test of samples with n1 and n2 entries, indexed by the U statistic of the first sample
+    """
+    # The null distribution of U is the same for (n1, n2) and (n2, n1)
+    n1, n2 = min(n1, n2), max(n1, n2)
+    return _load_table(
+        f"mannwhitneyu_{n1}_{n2}_{alternative}",
+        lambda: _pvalue_table(_mannwhitneyu_counts(n1, n2), alternative),
+        cache_dir,
+    )
+
+
+def _has_ties(values):
+    ordered = np.sort(values, axis=1)
+    return (np.diff(ordered, axis=1) == 0).any(axis=1)
+
+
+def _ranks(values):
+    # Ranks 1..n along the rows, only valid without ties
+    return np.argsort(np.argsort(values, axis=1), axis=1) + 1
+
+
+def _exact_rows(a, b, is_related, alternative, cache_dir):
+    if is_related:
+        diff = a - b
+        ranks = _ranks(np.abs(diff))
+        r_plus = np.where(diff > 0, ranks, 0).sum(axis=1)
+        n = a.shape[1]
+        pvalue = wilcoxon_table(n, alternative, cache_dir)[r_plus]
+        if alternative == "two-sided":
+            return np.minimum(r_plus, n * (n + 1) // 2 - r_plus).astype(float), pvalue
+        return r_plus.astype(float), pvalue
+
+    n1, n2 = a.shape[1], b.shape[1]
+    ranks = _ranks(np.concatenate([a, b], axis=1))
+    u1 = ranks[:, :n1].sum(axis=1) - n1 * (n1 + 1) // 2
+    return u1.astype(float), mannwhitneyu_table(n1, n2, alternative, cache_dir)[u1]
+
+
+def rank_test_rows(a, b, is_related, alternative, cache_dir=TABLE_DIR):
+    """
+    Wilcoxon signed-rank (zero_method="pratt") or Mann-Whitney U test of every row of the 2D arrays a and b.
+    Returns the statistics and p-values as reported by scipy with the method chosen for every row.
+    """
+    from scipy.stats import wilcoxon, mannwhitneyu
+
+    # NaN entries propagate to the results, as with scipy
+    missing = np.isnan(a).any(axis=1) | np.isnan(b).any(axis=1)
+
+    # The exact distribution does not hold with ties or zeros, these rows use the normal approximation
+    if is_related:
+        diff = a - b
+        ties = _has_ties(np.abs(diff)) | (diff == 0).any(axis=1)
+        exact = a.shape[1] <= WILCOXON_EXACT_MAX
+    else:
+        ties = _has_ties(np.concatenate([a, b], axis=1))
+        exact = min(a.shape[1], b.shape[1]) <= MANNWHITNEYU_EXACT_MAX
+
+    statistic = np.full(a.shape[0], np.nan)
+    pvalue = np.full(a.shape[0], np.nan)
+    for tied in (False, True):
+        rows = (ties == tied) & ~missing
+        if not rows.any():
+            continue
+        if exact and not tied:
+            statistic[rows], pvalue[rows] = _exact_rows(
+                a[rows], b[rows], is_related, alternative, cache_dir
+            )
+            continue
+
+        if is_related:
+            result = wilcoxon(
+                a[rows],
+                b[rows],
+                alternative=alternative,
+                # https://www.tandfonline.com/doi/abs/10.1080/01621459.1959.10501526
+                zero_method="pratt",
+                method="asymptotic",
+                axis=1,
+            )
+        else:
+            result = mannwhitneyu(
+                a[rows], b[rows], alternative=alternative, method="asymptotic", axis=1
+            )
+        statistic[rows] = result.statistic
+        pvalue[rows] = result.pvalue
+
+    return statistic, pvalue
@@ -0,0 +1,262 @@
+import os
+import warnings
+from contextlib import contextmanager
+import numpy as np
+from instrumentation import traced
+
+# Upper bound for the number of values drawn per chunk, keeps each index matrix at ~8MB
+CHUNK_VALUES = 1_000_000
+
+
+def chunk_sizes(n_resamples, n_values, chunk_size=None):
+    """
+    Sizes of the chunks of n_resamples resamples with n_values each,
+    by default a chunk holds at most CHUNK_VALUES values
+    """
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_VALUES // max(n_values, 1))
+    chunks = [chunk_size] * (n_resamples // chunk_size)
+    if n_resamples % chunk_size:
+        chunks.append(n_resamples % chunk_size)
+    return chunks
+
+
+@contextmanager
+def resampling_pool(max_workers=None):
+    """
+    Process pool shared by the resamplings of a study, None (resamples in this process) with a single CPU
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1:
+        yield None
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        yield pool
+
+
+def map_jobs(worker, jobs, max_workers=None, executor=None, chunksize=1):
+    """
+    Results of the worker for every job (a tuple of its arguments), in the order of the jobs.
+    The jobs run in the executor if given, otherwise in a process pool of their own,
+    or in this process for a single job or a single CPU.
+    """
+    if not jobs:
+        return []
+
+    if executor is None:
+        max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if len(jobs) == 1 or (executor is None and max_workers == 1):
+        return [worker(*job) for job in jobs]
+    if executor is not None:
+        return list(executor.map(worker, *zip(*jobs), chunksize=chunksize))
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(worker, *zip(*jobs), chunksize=chunksize))
+
+
+def seeded_jobs(args, chunks, seed):
+    """
+    Jobs (*args, seed, size) of the chunks, each chunk gets its own child of the seed (an int or a SeedSequence).
+    The results therefore only depend on the seed and the chunk size, not on the number of processes.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [
+        (*args, chunk_seed, size)
+        for chunk_seed, size in zip(seed.spawn(len(chunks)), chunks)
+    ]
+
+
+def map_chunks(worker, args, chunks, seed, max_workers=None, executor=None):
+    """
+    Runs the worker for every chunk of seeded_jobs, see map_jobs
+    """
+    return map_jobs(
+        worker, seeded_jobs(args, chunks, seed), max_workers, executor=executor
+    )
+
+
+def cohens_d_rows(a, b):
+    """
+    Cohen's d with pooled standard deviation (see util.calculate_cohends_d) for every row of a and b
+    """
+    n1, n2 = a.shape[-1], b.shape[-1]
+    s1, s2 = a.std(axis=-1, ddof=1), b.std(axis=-1, ddof=1)
+    pooled_std = np.sqrt(((n1 - 1) * s1**2 + (n2 - 1) * s2**2) / (n1 + n2 - 2))
+    return (a.mean(axis=-1) - b.mean(axis=-1)) / pooled_std
+
+
+def _bootstrap_chunk(a, b, is_related, seed, size):
+    rng = np.random.default_rng(seed)
+    index_a = rng.integers(0, len(a), size=(size, len(a)))
+    # Related samples are resampled as pairs
+    index_b = index_a if is_related else rng.integers(0, len(b), size=(size, len(b)))
+    # Degenerate resamples are counted and dropped by bootstrap_cohends_d
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return cohens_d_rows(a[index_a], b[index_b])
+
+
+@traced()
+def bootstrap_cohends_d(
+    a,
+    b,
+    is_related,
+    n_resamples=100_000,
+    confidence=0.95,
+    seed=0,
+    chunk_size=None,
+    max_workers=None,
+    executor=None,
+):
+    """
+    Percentile bootstrap confidence interval of Cohen's d.
+    All resamples of a chunk are drawn as one index matrix, chunks are distributed across processes.
+    """
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if is_related and len(a) != len(b):
+        raise ValueError("Related samples must have the same size.")
+    if n_resamples < 1:
+        raise ValueError("At least one resample is required.")
+
+    chunks = chunk_sizes(n_resamples, len(a) + len(b), chunk_size)
+    estimates = np.concatenate(
+        map_chunks(
+            _bootstrap_chunk,
+            (a, b, is_related),
+            chunks,
+            seed,
+            max_workers,
+            executor=executor,
+        )
+    )
+
+    # Resamples without variance in both samples have no finite effect size (pooled standard deviation 0)
+    finite = np.isfinite(estimates)
+    dropped = len(estimates) - np.count_nonzero(finite)
+    if dropped:
+        warnings.warn(
+            f"{dropped} of {len(estimates)} bootstrap resamples without a finite Cohen's d were dropped",
+            RuntimeWarning,
+        )
+    if dropped == len(estimates):
+        return np.nan, np.nan
+
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(estimates[finite], [alpha, 1 - alpha])
+    return low, high
+
+
+def _extreme_count(statistics, observed, alternative):
+    # Small tolerance so permutations equal to the observed statistic are counted despite rounding errors
+    tolerance = 1e-12 * max(abs(observed), 1)
+    if alternative == "greater":
+        return np.count_nonzero(statistics >= observed - tolerance)
+    elif alternative == "less":
+        return np.count_nonzero(statistics <= observed + tolerance)
+    else:
+        return np.count_nonzero(np.abs(statistics) >= abs(observed) - tolerance)
+
+
+def _permutation_chunk(a, b, is_related, alternative, seed, size):
+    rng = np.random.default_rng(seed)
+
+    if is_related:
+        # Under the null hypothesis the sign of each paired difference is exchangeable
+        diff = a - b
+        signs = rng.choice(np.array([-1.0, 1.0]), size=(size, len(diff)))
+        statistics = (signs * diff).mean(axis=1)
+        observed = diff.mean()
+    else:
+        # Under the null hypothesis the group labels are exchangeable
+        pooled = np.concatenate([a, b])
+        index = rng.permuted(np.tile(np.arange(len(pooled)), (size, 1)), axis=1)
+        permuted = pooled[index]
+        statistics = permuted[:, : len(a)].mean(axis=1) - permuted[:, len(a) :].mean(
+            axis=1
+        )
+        observed = a.mean() - b.mean()
+
+    return _extreme_count(statistics, observed, alternative)
+
+
+@traced()
+def permutation_test(
+    a,
+    b,
+    is_related,
+    alternative="greater",
+    n_resamples=100_000,
+    seed=0,
+    chunk_size=None,
+    max_workers=None,
+    executor=None,
+):
+    """
+    Permutation p-value for the difference in means between a and b.
+    Related samples flip the signs of the paired differences, independent samples shuffle the group labels.
+    """
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if is_related and len(a) != len(b):
+        raise ValueError("Related samples must have the same size.")
+    if n_resamples < 1:
+        raise ValueError("At least one resample is required.")
+
+    chunks = chunk_sizes(n_resamples, len(a) + len(b), chunk_size)
+    extreme = sum(
+        map_chunks(
+            _permutation_chunk,
+            (a, b, is_related, alternative),
+            chunks,
+            seed,
+            max_workers,
+            executor=executor,
+        )
+    )
+
+    # The observed assignment is one of the permutations, which keeps the p-value above 0
+    return (extreme + 1) / (n_resamples + 1)
+
+
+def resample_inference(
+    a,
+    b,
+    is_related,
+    alternative="greater",
+    n_resamples=100_000,
+    seed=0,
+    max_workers=None,
+    executor=None,
+):
+    """
+    Bootstrap confidence interval of Cohen's d and permutation p-value of one comparison,
+    both resamplings run in the executor if given (see resampling_pool)
+    """
+    cohens_low, cohens_high = bootstrap_cohends_d(
+        a,
+        b,
+        is_related,
+        n_resamples=n_resamples,
+        seed=seed,
+        max_workers=max_workers,
+        executor=executor,
+    )
+    pvalue = permutation_test(
+        a,
+        b,
+        is_related,
+        alternative=alternative,
+        n_resamples=n_resamples,
+        seed=seed,
+        max_workers=max_workers,
+        executor=executor,
+    )
+    return {
+        "cohens_low": cohens_low,
+        "cohens_high": cohens_high,
+        "p_permutation": pvalue,
+    }
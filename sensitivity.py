@@ -0,0 +1,334 @@
+"""
+Leave-one-out sensitivity of the study tests.
+
+    python sensitivity.py [--studies pre main] [--units User Exercise] [--workers 4]
+
+Every test of pre_study and main_study is run again with each user and each exercise left out in turn.
+The tests compare the mean values of cells (e.g. the entries of a User and ExerciseSkill), the means of all cells
+are aggregated once and every leave-out only averages the cells containing the left out user or exercise again.
+The means are computed like the studies compute them, so ties between cells and the p-values of rank tests match.
+The leave-outs run in parallel processes.
+Writes the statistic, p-value and Cohen's d of every leave-out to results/sensitivity.csv and their stability
+per test (range, jackknife standard error of Cohen's d, most influential unit) to results/sensitivity_summary.csv.
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from data_preparation import read_preprocessed
+from instrumentation import traced
+from resampling import map_jobs
+
+OUTPUT_PATH = "results/sensitivity.csv"
+SUMMARY_PATH = "results/sensitivity_summary.csv"
+
+UNITS = ["User", "Exercise"]
+
+# Tests of pre_study and main_study. Sample a holds the trained skills (pre) or the recommended users (main).
+# Values are averaged per cell, related samples are paired by the pair columns of their cells.
+TESTS = [
+    {
+        "study": "pre",
+        "type": "normalized_change_skill",
+        "cells": ["User", "ExerciseSkill"],
+        "pair": ["User"],
+        "value": "NormalizedChange",
+        "summary": None,
+        "is_graph_norm": True,
+        "alternative": "greater",
+    },
+    {
+        "study": "pre",
+        "type": "normalized_change_exercise",
+        # Entries are paired with the entry of the other sample at the same position within the user
+        "cells": ["User", "Position"],
+        "pair": ["User", "Position"],
+        "value": "NormalizedChange",
+        "summary": None,
+        "is_graph_norm": False,
+        "alternative": "greater",
+    },
+    {
+        "study": "main",
+        "type": "normalized_change_skills",
+        "cells": ["User", "ExerciseSkill"],
+        "pair": None,
+        "value": "NormalizedChange",
+        "summary": None,
+        "is_graph_norm": False,
+        "alternative": "greater",
+    },
+    {
+        "study": "main",
+        "type": "normalized_change_user",
+        "cells": ["User"],
+        "pair": None,
+        "value": "NormalizedChange",
+        "summary": None,
+        "is_graph_norm": False,
+        "alternative": "greater",
+    },
+    {
+        "study": "main",
+        "type": "reduced_deviation",
+        "cells": ["User", "ExerciseSkill"],
+        "pair": None,
+        "value": "PosttestCorrectRel",
+        # Coefficient of variation of the skill means of each user
+        "summary": "cv",
+        "is_graph_norm": False,
+        "alternative": "less",
+    },
+]
+
+
+def study_entries(study_name):
+    """
+    Preprocessed entries of the study with the sample of every entry (a or b) as Side
+    and its position among the entries of the same user and sample as Position
+    """
+    if study_name == "pre":
+        import pre_study
+
+        data = read_preprocessed("pre", columns=pre_study.COLUMNS)
+        side = data.index.isin(
+            pre_study.extract_entries(df=data, was_trained=True).index
+        )
+    elif study_name == "main":
+        import main_study
+
+        data = read_preprocessed("main", columns=main_study.COLUMNS)
+        side = main_study.is_recommended(data["User"]).to_numpy()
+    else:
+        raise ValueError(study_name)
+
+    data = data.assign(Side=np.where(side, "a", "b"))
+    data["Position"] = data.groupby(["User", "Side"]).cumcount()
+    return data
+
+
+def cell_keys(test):
+    return ["Side", *test["cells"]]
+
+
+def cell_means(entries, test):
+    """
+    Mean value of every cell, averaged like the studies average their cells
+    """
+    return entries.groupby(cell_keys(test), observed=True)[test["value"]].mean()
+
+
+def left_out_means(entries, test, unit):
+    """
+    Means of the cells containing entries of a user or exercise (level LeftOut) without these entries,
+    NaN for cells left empty
+    """
+    keys = cell_keys(test)
+    # Every cell is paired with the units it contains, the entries keep their order within the cell
+    pairs = entries[keys].assign(LeftOut=entries[unit]).drop_duplicates()
+    remaining = pairs.merge(
+        entries[keys].assign(
+            Unit=entries[unit],
+            Value=entries[test["value"]],
+            Row=np.arange(len(entries)),
+        ),
+        on=keys,
+    )
+    remaining = remaining.loc[remaining["Unit"] != remaining["LeftOut"]].sort_values(
+        ["LeftOut", "Row"], kind="stable"
+    )
+    means = remaining.groupby(["LeftOut", *keys], observed=True)["Value"].mean()
+    return means.rename(test["value"]).reindex(
+        pd.MultiIndex.from_frame(pairs[["LeftOut", *keys]])
+    )
+
+
+def _samples(means, test):
+    if test["summary"] == "cv":
+        grouped = means.groupby(level=["Side", "User"])
+        means = grouped.std() / grouped.mean() * 100
+
+    if test["pair"] is not None:
+        unpaired = [level for level in test["cells"] if level not in test["pair"]]
+        if unpaired:
+            means = means.droplevel(unpaired)
+        paired = means.unstack("Side").reindex(columns=["a", "b"]).dropna()
+        return paired["a"].to_numpy(), paired["b"].to_numpy()
+
+    means = means.dropna()
+    side = means.index.get_level_values("Side")
+    return means[side == "a"].to_numpy(), means[side == "b"].to_numpy()
+
+
+def _leave_out(test, means, unit, left_out, changed):
+    from batch_testing import test_matrix
+    from effect_sizes import cohens_d
+
+    if changed is not None:
+        means = means.copy()
+        means.loc[changed.index] = changed
+    a, b = _samples(means, test)
+
+    row = {
+        "study": test["study"],
+        "type": test["type"],
+        "unit": unit,
+        "left_out": left_out,
+        "n_a": len(a),
+        "n_b": len(b),
+    }
+    if len(a) == 0 or len(b) == 0:
+        return {**row, "statistic": np.nan, "p": np.nan, "test": None, "cohens": np.nan}
+
+    tested = test_matrix(
+        a,
+        b,
+        is_related=test["pair"] is not None,
+        is_graph_norm=test["is_graph_norm"],
+        alternative=test["alternative"],
+    )
+    return {
+        **row,
+        "statistic": tested["statistic"][0],
+        "p": tested["p"][0],
+        "test": tested["test"][0],
+        "cohens": cohens_d(a, b),
+    }
+
+
+@traced()
+def leave_one_out(studies=("pre", "main"), units=UNITS, max_workers=None):
+    """
+    Results of every test of the studies on all entries (unit and left_out empty) and with each unit left out.
+    The cell means of a test are computed once, every leave-out replaces the means of the cells containing the unit.
+    """
+    jobs = []
+    for study_name in studies:
+        entries = study_entries(study_name)
+        for test in TESTS:
+            if test["study"] != study_name:
+                continue
+            means = cell_means(entries, test)
+            jobs.append((test, means, None, None, None))
+            for unit in units:
+                for left_out, changed in left_out_means(entries, test, unit).groupby(
+                    level="LeftOut"
+                ):
+                    jobs.append(
+                        (test, means, unit, left_out, changed.droplevel("LeftOut"))
+                    )
+
+    # Single tests are fast, jobs are sent to the processes in batches to keep the overhead low
+    batches = 4 * (max_workers or os.cpu_count() or 1)
+    results = map_jobs(
+        _leave_out, jobs, max_workers, chunksize=max(1, len(jobs) // batches)
+    )
+
+    table = pd.DataFrame(results)
+    # Users and exercises are identified by integers, the rows on all entries have none
+    table["left_out"] = table["left_out"].astype("Int64")
+    return table
+
+
+def compare_results(table, results_dir="results", rtol=1e-6):
+    """
+    Statistic, p-value and Cohen's d of the rows on all entries next to the ones reported by the studies
+    (results/{study}_evaluation.csv), matching within the relative tolerance.
+    """
+    columns = {"t": "statistic", "p": "p", "cohens": "cohens"}
+    baseline = table.loc[table["unit"].isna(), ["study", "type", *columns.values()]]
+    reported = []
+    for study_name in baseline["study"].unique():
+        path = os.path.join(results_dir, f"{study_name}_evaluation.csv")
+        if os.path.exists(path):
+            reported.append(
+                pd.read_csv(path, usecols=["type", *columns]).assign(study=study_name)
+            )
+    if not reported:
+        return baseline.assign(matches=pd.NA)
+
+    compared = baseline.merge(
+        pd.concat(reported, ignore_index=True).rename(
+            columns={column: f"{name}_reported" for column, name in columns.items()}
+        ),
+        on=["study", "type"],
+        how="left",
+    )
+    compared["matches"] = np.logical_and.reduce(
+        [
+            np.isclose(compared[name], compared[f"{name}_reported"], rtol=rtol)
+            for name in columns.values()
+        ]
+    )
+    return compared
+
+
+def summarize(table, alpha=0.05):
+    """
+    Stability of every test per unit: range of the p-values and Cohen's d over the leave-outs, share of
+    leave-outs with a significant result, jackknife standard error of Cohen's d and the unit changing it the most
+    """
+    baseline = table.loc[table["unit"].isna()].set_index(["study", "type"])
+    rows = []
+    for (study_name, test_type, unit), group in table.dropna(subset=["unit"]).groupby(
+        ["study", "type", "unit"], sort=False
+    ):
+        base = baseline.loc[(study_name, test_type)]
+        k = len(group)
+        influence = (group["cohens"] - base["cohens"]).abs().dropna()
+        rows.append(
+            {
+                "study": study_name,
+                "type": test_type,
+                "unit": unit,
+                "leave_outs": k,
+                "p": base["p"],
+                "p_min": group["p"].min(),
+                "p_max": group["p"].max(),
+                "significant_share": (group["p"] < alpha).mean(),
+                "cohens": base["cohens"],
+                "cohens_min": group["cohens"].min(),
+                "cohens_max": group["cohens"].max(),
+                "cohens_jackknife_se": np.sqrt(
+                    (k - 1)
+                    / k
+                    * ((group["cohens"] - group["cohens"].mean()) ** 2).sum()
+                ),
+                "most_influential": (
+                    group.loc[influence.idxmax(), "left_out"]
+                    if len(influence)
+                    else pd.NA
+                ),
+            }
+        )
+    summary = pd.DataFrame(rows)
+    if len(summary):
+        summary["most_influential"] = summary["most_influential"].astype("Int64")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--studies", nargs="+", default=["pre", "main"])
+    parser.add_argument("--units", nargs="+", default=UNITS, choices=UNITS)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, help="processes running the leave-outs")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--summary", default=SUMMARY_PATH)
+    args = parser.parse_args()
+
+    table = leave_one_out(args.studies, args.units, max_workers=args.workers)
+    summary = summarize(table, alpha=args.alpha)
+    table.to_csv(args.output, index=None)
+    summary.to_csv(args.summary, index=None)
+    print(summary.to_string(index=False))
+
+    compared = compare_results(table)
+    if not compared["matches"].fillna(False).all():
+        print("Results on all entries differ from the reported ones:")
+        print(compared.loc[~compared["matches"].fillna(False)].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
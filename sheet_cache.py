@@ -0,0 +1,214 @@
+import hashlib
+import os
+import re
+from array import array
+import numpy as np
+import pandas as pd
+from instrumentation import span, traced
+
+CACHE_DIR = "cache"
+
+# Version of the parsed entries, bump it whenever parse_sheet returns different frames for the same workbook
+CACHE_VERSION = 2
+
+# Name of an entry after its prefix, entries of earlier versions had none or another one
+_ENTRY_NAME = re.compile(r"[0-9a-f]{64}(\.v\d+)?\.feather")
+
+
+def workbook_digest(path, chunk_size=1 << 20):
+    """
+    Content hash of the workbook, any edit of the file results in a new digest
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _cache_prefix(path, sheet_name):
+    # Workbooks of the same name in other directories or with another extension get their own entries
+    workbook = os.path.splitext(os.path.basename(path))[0]
+    location = hashlib.sha256(os.path.normpath(os.path.relpath(path)).encode())
+    return f"{workbook}_{location.hexdigest()[:12]}_{sheet_name}_"
+
+
+def _entry_name(prefix, digest):
+    return f"{prefix}{digest}.v{CACHE_VERSION}.feather"
+
+
+def _remove_stale_entries(cache_dir, prefix, keep):
+    # Only entries of exactly this prefix and a digest, not the ones of sheets whose name extends the sheet name
+    for entry in os.listdir(cache_dir):
+        if (
+            entry.startswith(prefix)
+            and _ENTRY_NAME.fullmatch(entry[len(prefix) :])
+            and entry != keep
+        ):
+            os.remove(os.path.join(cache_dir, entry))
+
+
+class _ColumnBuffer:
+    """
+    Values of one column in a typed buffer, integers are stored as int64 until a float arrives and as
+    float64 until any other value arrives, which falls back to a list of objects
+    """
+
+    def __init__(self):
+        self._values = array("q")
+
+    def append(self, value):
+        # Like pandas.read_excel, integral floats are read as integers
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+
+        if isinstance(self._values, array):
+            kind = self._values.typecode
+            if isinstance(value, bool):
+                pass
+            elif isinstance(value, int) and kind == "q" and -(2**63) <= value < 2**63:
+                self._values.append(value)
+                return
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                if kind == "q":
+                    self._values = array("d", self._values)
+                self._values.append(value)
+                return
+            elif value is None:
+                if kind == "q":
+                    self._values = array("d", self._values)
+                self._values.append(np.nan)
+                return
+            self._values = list(self._values)
+        self._values.append(value)
+
+    def to_numpy(self):
+        if isinstance(self._values, array):
+            return np.frombuffer(self._values, dtype=self._values.typecode).copy()
+        # Missing values of object columns are NaN, as with pandas.read_excel
+        values = pd.Series(
+            [np.nan if value is None else value for value in self._values],
+            dtype=object,
+        )
+        return values.infer_objects().to_numpy()
+
+
+def _deduplicate(columns):
+    # Repeated column names are numbered as by pandas.read_excel: A, A.1, A.2, skipping numbered
+    # names that appear anywhere within the header
+    columns = list(columns)
+    taken = set(columns)
+    counts = dict()
+    for i, name in enumerate(columns):
+        count = counts.get(name, 0)
+        candidate = name
+        while count > 0:
+            counts[name] = count + 1
+            candidate = f"{name}.{count}"
+            count = count + 1 if candidate in taken else counts.get(candidate, 0)
+        columns[i] = candidate
+        counts[candidate] = count + 1
+    return columns
+
+
+def parse_sheet(path, sheet_name):
+    """
+    Parses the sheet with the streaming read-only reader of openpyxl, the first row holds the column names.
+    Rows are converted straight into typed column buffers, the workbook is never loaded as a whole.
+    """
+    import openpyxl
+
+    with span("parse_sheet", workbook=path, sheet=sheet_name):
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            while header and header[-1] is None:
+                header.pop()
+            columns = _deduplicate(
+                f"Unnamed: {i}" if name is None else name
+                for i, name in enumerate(header)
+            )
+
+            buffers = [_ColumnBuffer() for _ in columns]
+            for row in rows:
+                row = row[: len(columns)]
+                # Blank rows are skipped, as with pandas.read_excel
+                if all(value is None for value in row):
+                    continue
+                for buffer, value in zip(buffers, row):
+                    buffer.append(value)
+                for buffer in buffers[len(row) :]:
+                    buffer.append(None)
+        finally:
+            workbook.close()
+
+    return pd.DataFrame(
+        {column: buffer.to_numpy() for column, buffer in zip(columns, buffers)}
+    )
+
+
+def _parse_entry(path, sheet_name, entry_path):
+    sheet = parse_sheet(path, sheet_name)
+    # Write to a temporary file first so an interrupted run never leaves a truncated entry behind
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+    sheet.to_feather(tmp_path)
+    os.replace(tmp_path, entry_path)
+    return entry_path
+
+
+@traced()
+def read_workbooks(workbooks, cache_dir=CACHE_DIR, max_workers=None):
+    """
+    Reads the given sheets of several workbooks, workbooks maps the path of each workbook to its sheet names.
+    Parsed sheets are stored as feather files keyed by the content hash of the workbook, the sheet name and
+    CACHE_VERSION, entries of other versions are replaced.
+    Sheets are only parsed from the xlsx files on a cache miss, all missing sheets are parsed concurrently in
+    worker processes. Returns the sheets as dictionary of workbook path to sheet name to DataFrame.
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    entries = dict()
+    missing = []
+    for path, sheet_names in workbooks.items():
+        digest = workbook_digest(path)
+        for sheet_name in sheet_names:
+            prefix = _cache_prefix(path, sheet_name)
+            entry = _entry_name(prefix, digest)
+            entries[(path, sheet_name)] = (prefix, entry)
+            if not os.path.exists(os.path.join(cache_dir, entry)):
+                missing.append((path, sheet_name, os.path.join(cache_dir, entry)))
+
+    if len(missing) == 1 or max_workers == 1:
+        for job in missing:
+            _parse_entry(*job)
+    elif missing:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers or os.cpu_count(), len(missing))
+        ) as pool:
+            list(pool.map(_parse_entry, *zip(*missing)))
+
+    for path, sheet_name, _ in missing:
+        prefix, entry = entries[(path, sheet_name)]
+        _remove_stale_entries(cache_dir, prefix, keep=entry)
+
+    sheets = {path: dict() for path in workbooks}
+    for (path, sheet_name), (_, entry) in entries.items():
+        sheets[path][sheet_name] = pd.read_feather(os.path.join(cache_dir, entry))
+    return sheets
+
+
+def read_sheets(path, sheet_names, cache_dir=CACHE_DIR, max_workers=None):
+    """
+    Reads the given sheets of the workbook, see read_workbooks
+    """
+    return read_workbooks(
+        {path: sheet_names}, cache_dir=cache_dir, max_workers=max_workers
+    )[path]
+
+
+def read_sheet(path, sheet_name, cache_dir=CACHE_DIR):
+    return read_sheets(path, [sheet_name], cache_dir=cache_dir)[sheet_name]
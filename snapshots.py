@@ -0,0 +1,253 @@
+import json
+import os
+import re
+import pandas as pd
+from tracing import TRACING_DTYPES, concat_tracing
+
+SNAPSHOT_DIR = "abzuege"
+OUTPUT_DIR = "preprocessed/snapshots"
+
+# Snapshots are named after the time of the dump, e.g. d14_m02_h23_m30.json
+SNAPSHOT_PATTERN = re.compile(r"d(\d{2})_m(\d{2})_h(\d{2})_m(\d{2})\.json$")
+
+# The dumps do not contain the year, the study took place in 2023
+SNAPSHOT_YEAR = 2023
+
+MANIFEST = "manifest.json"
+
+
+def snapshot_time(filename, year=SNAPSHOT_YEAR):
+    match = SNAPSHOT_PATTERN.search(os.path.basename(filename))
+    if match is None:
+        raise ValueError(filename)
+    day, month, hour, minute = map(int, match.groups())
+    return pd.Timestamp(year=year, month=month, day=day, hour=hour, minute=minute)
+
+
+# Characters ending a number or literal, and the characters to look at within strings and containers
+_SCALAR_END = re.compile(r"[,\]\s]")
+_STRING_TOKEN = re.compile(r'["\\]')
+_CONTAINER_TOKEN = re.compile(r'["{}\[\]]')
+
+
+def _string_end(buffer, start):
+    # Index after the closing quote of the string opening at start, None if it continues after the buffer
+    match = _STRING_TOKEN.search(buffer, start + 1)
+    while match and match.group() == "\\":
+        match = _STRING_TOKEN.search(buffer, match.end() + 1)
+    return match.end() if match else None
+
+
+def _value_end(buffer, start):
+    """
+    Index after the JSON value starting at start without decoding it: after the closing brace or bracket
+    of objects and arrays, the closing quote of strings, before the delimiter after numbers and literals.
+    None if the value continues after the buffer.
+    """
+    opening = buffer[start]
+    if opening == '"':
+        return _string_end(buffer, start)
+    if opening not in "{[":
+        match = _SCALAR_END.search(buffer, start)
+        return match.start() if match else None
+
+    depth = 0
+    position = start
+    while True:
+        match = _CONTAINER_TOKEN.search(buffer, position)
+        if match is None:
+            return None
+        if match.group() == '"':
+            position = _string_end(buffer, match.start())
+            if position is None:
+                return None
+            continue
+        depth += 1 if match.group() in "{[" else -1
+        position = match.end()
+        if depth == 0:
+            return position
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """
+    Yields the elements of the JSON array within the file one after another,
+    only the current element and a chunk of the file are held in memory. Empty files yield nothing.
+    Raises a ValueError with the byte offset for malformed arrays (malformed or empty elements, missing separators,
+    data after the array) as soon as the malformed part has been read.
+    """
+    decoder = json.JSONDecoder()
+    encoding = getattr(file, "encoding", None) or "utf-8"
+    buffer = ""
+    position = 0
+    # Bytes of the file before the buffer
+    offset = 0
+    eof = False
+    # Next expected token: "[" at the start, an element or "]" after "[", an element after ",",
+    # "," or "]" after an element and nothing but whitespace after "]"
+    expected = "start"
+
+    def malformed(message, index):
+        return ValueError(
+            f"{message} at byte {offset + len(buffer[:index].encode(encoding))}."
+        )
+
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n":
+            position += 1
+
+        if position < len(buffer):
+            char = buffer[position]
+            if expected == "start":
+                if char != "[":
+                    raise malformed("Expected a JSON array", position)
+                expected = "first"
+                position += 1
+                continue
+            if expected == "end":
+                raise malformed("Unexpected data after the JSON array", position)
+            if char == "]" and expected in ("first", "separator"):
+                expected = "end"
+                position += 1
+                continue
+            if expected == "separator":
+                if char != ",":
+                    raise malformed(
+                        f"Expected ',' or ']' instead of {char!r}", position
+                    )
+                expected = "element"
+                position += 1
+                continue
+
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                element, end = None, None
+            if end is not None:
+                # An element is complete once the delimiter after it has been read,
+                # a number cut off at the end of the chunk (e.g. "4." of "4.5e3") would be decoded too early
+                delimiter = end
+                while delimiter < len(buffer) and buffer[delimiter] in " \t\r\n":
+                    delimiter += 1
+                if (delimiter < len(buffer) and buffer[delimiter] in ",]") or (
+                    eof and delimiter == len(buffer)
+                ):
+                    yield element
+                    position = end
+                    expected = "separator"
+                    continue
+
+            # Elements that cannot be decoded or are followed by anything but a delimiter are malformed, they are
+            # only read until their end (a number may still continue in the next chunk), not until the end of the file
+            if end is None or delimiter < len(buffer):
+                if eof or _value_end(buffer, position) is not None:
+                    raise malformed("Malformed element", position)
+
+        if eof:
+            if expected in ("start", "end"):
+                return
+            raise malformed("Unterminated JSON array", position)
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        offset += len(buffer[:position].encode(encoding))
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def read_snapshot(path, year=SNAPSHOT_YEAR):
+    """
+    Parses a snapshot dump into the schema of the tracing export (Date, UserId, SkillId, Mastery),
+    the Date being the time of the snapshot
+    """
+    users, skills, mastery = [], [], []
+    # Line endings are not translated, the byte offsets of parse errors stay exact
+    with open(path, encoding="utf-8", newline="") as file:
+        for entry in iter_json_array(file):
+            users.append(entry["userId"])
+            skills.append(entry["skillId"])
+            mastery.append(entry["mastery"])
+
+    data = pd.DataFrame(
+        {
+            "Date": pd.Series(
+                [snapshot_time(path, year)] * len(users), dtype="datetime64[ns]"
+            ),
+            "UserId": users,
+            "SkillId": skills,
+            "Mastery": mastery,
+        }
+    ).astype(TRACING_DTYPES)
+
+    # A snapshot holds one mastery per (user, skill), repeated entries keep the latest one
+    return data.drop_duplicates(["UserId", "SkillId"], keep="last", ignore_index=True)
+
+
+def _load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def ingest_snapshots(
+    snapshot_dir=SNAPSHOT_DIR, output_dir=OUTPUT_DIR, year=SNAPSHOT_YEAR
+):
+    """
+    Converts every new or changed snapshot dump of snapshot_dir into its own parquet partition.
+    The manifest remembers the processed dumps, so each run only parses the dumps that arrived since.
+    Returns the names of the ingested dumps.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+    ingested = []
+
+    for name in sorted(os.listdir(snapshot_dir)):
+        if SNAPSHOT_PATTERN.search(name) is None:
+            continue
+
+        path = os.path.join(snapshot_dir, name)
+        stat = os.stat(path)
+        fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if manifest.get(name, dict()).get("fingerprint") == fingerprint:
+            continue
+
+        snapshot = read_snapshot(path, year=year)
+        partition = f"{os.path.splitext(name)[0]}.parquet"
+        snapshot.to_parquet(os.path.join(output_dir, partition), index=False)
+
+        manifest[name] = {
+            "fingerprint": fingerprint,
+            "partition": partition,
+            "rows": len(snapshot),
+        }
+        # Saved after every dump, an interrupted run keeps the progress made so far
+        _save_manifest(output_dir, manifest)
+        ingested.append(name)
+
+    return ingested
+
+
+def load_snapshots(output_dir=OUTPUT_DIR):
+    """
+    Mastery table of all ingested snapshots sorted by Date, keyed by (UserId, SkillId, Date)
+    """
+    manifest = _load_manifest(output_dir)
+    return concat_tracing(
+        pd.read_parquet(os.path.join(output_dir, entry["partition"])).astype(
+            TRACING_DTYPES
+        )
+        for _, entry in sorted(manifest.items())
+    )
+
+
+if __name__ == "__main__":
+    ingested = ingest_snapshots()
+    print(f"Ingested {len(ingested)} new snapshots: {', '.join(ingested)}")
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from bkt import PARAMETERS, _expectation, fit_bkt
+
+
+def _observations(rng, users=40, steps=15):
+    # Users learn the skill at a random step, known skills are mostly answered correctly
+    learned = rng.integers(0, steps, size=(users, 1))
+    known = np.arange(steps) >= learned
+    correct = rng.random((users, steps)) < np.where(known, 0.9, 0.2)
+    observations = correct.astype(float)
+    # Missing observations, more often towards the end of the sequences
+    observations[rng.random((users, steps)) < np.linspace(0, 0.5, steps)] = np.nan
+    observations[:, 0] = correct[:, 0]
+    return observations
+
+
+@pytest.mark.parametrize("max_iterations", [3, 200])
+def test_log_likelihood_belongs_to_the_returned_parameters(max_iterations):
+    observations = _observations(np.random.default_rng(0))
+
+    fitted = fit_bkt(observations, max_iterations=max_iterations)
+
+    parameters = {name: fitted[name] for name in PARAMETERS}
+    assert fitted["converged"] == (max_iterations == 200)
+    assert fitted["log_likelihood"] == _expectation(observations, **parameters)[2]
@@ -0,0 +1,25 @@
+import pandas as pd
+from kt_visualization import study_cohorts
+from main_study import extract_entries, is_recommended
+
+
+def test_odd_users_are_recommended():
+    users = pd.Series(range(1, 13))
+
+    assert is_recommended(users).tolist() == [user % 2 == 1 for user in range(1, 13)]
+    assert is_recommended(1) and not is_recommended(2)
+    recommended = extract_entries(pd.DataFrame({"User": users}), was_recommended=True)
+    assert recommended["User"].tolist() == [1, 3, 5, 7, 9, 11]
+
+
+def test_cohort_labels_follow_the_study_split(tmp_path):
+    path = tmp_path / "users.csv"
+    pd.DataFrame({"UserId": ["a", "b", "c"], "User": [1, 2, 11]}).to_csv(
+        path, index=False
+    )
+
+    assert study_cohorts(path).to_dict() == {
+        "a": "Recommended",
+        "b": "Unrecommended",
+        "c": "Recommended",
+    }
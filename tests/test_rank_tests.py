@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from scipy.stats import mannwhitneyu, wilcoxon
+from rank_tests import rank_test_rows
+
+
+def _scipy(a, b, is_related, alternative, method):
+    if is_related:
+        return wilcoxon(
+            a, b, alternative=alternative, zero_method="pratt", method=method
+        )
+    return mannwhitneyu(a, b, alternative=alternative, method=method)
+
+
+@pytest.mark.parametrize("is_related", [True, False])
+@pytest.mark.parametrize("alternative", ["greater", "less", "two-sided"])
+def test_rows_without_ties_use_the_exact_distribution(is_related, alternative):
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(0.5, 1, size=(20, 8)), rng.normal(size=(20, 8))
+
+    statistic, pvalue = rank_test_rows(a, b, is_related, alternative, cache_dir=None)
+
+    for row in range(len(a)):
+        expected = _scipy(a[row], b[row], is_related, alternative, "exact")
+        assert statistic[row] == expected.statistic
+        assert pvalue[row] == pytest.approx(expected.pvalue, rel=1e-12)
+
+
+@pytest.mark.parametrize("is_related", [True, False])
+def test_rows_with_ties_use_the_normal_approximation(is_related):
+    rng = np.random.default_rng(1)
+    # Small samples of few distinct values, scipy's method="auto" would run a permutation test for some of them
+    a, b = rng.integers(0, 4, size=(20, 6)) / 4, rng.integers(0, 3, size=(20, 6)) / 4
+
+    statistic, pvalue = rank_test_rows(a, b, is_related, "greater", cache_dir=None)
+
+    for row in range(len(a)):
+        expected = _scipy(a[row], b[row], is_related, "greater", "asymptotic")
+        assert statistic[row] == expected.statistic
+        assert pvalue[row] == pytest.approx(expected.pvalue, rel=1e-12)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from resampling import (
+    _bootstrap_chunk,
+    map_chunks,
+    bootstrap_cohends_d,
+    permutation_test,
+)
+
+
+@pytest.mark.parametrize("resample", [bootstrap_cohends_d, permutation_test])
+def test_resampling_requires_resamples(resample):
+    with pytest.raises(ValueError, match="resample"):
+        resample([1.0, 2.0, 3.0], [2.0, 3.0, 5.0], is_related=False, n_resamples=0)
+
+
+def testmap_chunks_without_chunks():
+    assert map_chunks(_bootstrap_chunk, (None, None, False), [], 0, None) == []
+
+
+def test_permutation_test_independent_of_processes():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(0.5, size=12), rng.normal(size=12)
+
+    serial = permutation_test(
+        a, b, False, n_resamples=2000, chunk_size=300, max_workers=1
+    )
+    parallel = permutation_test(
+        a, b, False, n_resamples=2000, chunk_size=300, max_workers=2
+    )
+    assert serial == parallel
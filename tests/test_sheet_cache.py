@@ -0,0 +1,32 @@
+import os
+import openpyxl
+import sheet_cache
+from sheet_cache import read_sheet
+
+
+def _write_workbook(path, rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "pretest"
+    for row in rows:
+        sheet.append(row)
+    # Sheet whose name extends the name of the first one
+    workbook.create_sheet("pretest_v2").append(["User"])
+    workbook.save(path)
+
+
+def test_entries_of_other_versions_are_replaced(tmp_path, monkeypatch):
+    path, cache_dir = str(tmp_path / "pre.xlsx"), str(tmp_path / "cache")
+    _write_workbook(path, [["User", "Points"], [1, 3], [2, 4]])
+
+    read_sheet(path, "pretest_v2", cache_dir=cache_dir)
+    monkeypatch.setattr(sheet_cache, "CACHE_VERSION", 1)
+    read_sheet(path, "pretest", cache_dir=cache_dir)
+    monkeypatch.setattr(sheet_cache, "CACHE_VERSION", 2)
+    sheet = read_sheet(path, "pretest", cache_dir=cache_dir)
+
+    assert sheet["Points"].tolist() == [3, 4]
+    entries = sorted(os.listdir(cache_dir))
+    assert len(entries) == 2
+    assert entries[0].startswith("pre_") and entries[0].endswith(".v2.feather")
+    assert "_pretest_v2_" in entries[1]
@@ -0,0 +1,77 @@
+import io
+import json
+import pytest
+from snapshots import iter_json_array
+
+VALID = [
+    "[]",
+    " [ ] \n",
+    "[1, 2, 3]",
+    "[4.5e3, -0.25, 12345678]",
+    '[{"userId": "a", "mastery": 0.5}, {"userId": "b", "mastery": 1e-3}]',
+    '["x", [1, [2]], null, true, false]',
+]
+
+MALFORMED = [
+    "[1,,,2]",
+    ",[1]",
+    "[,1]",
+    "[1,]",
+    "[1 2]",
+    "[1] x",
+    "[1][2]",
+    "[4.x]",
+    "[1, 2",
+    "{}",
+]
+
+
+@pytest.mark.parametrize("text", VALID)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 1 << 16])
+def test_iter_json_array_matches_json(text, chunk_size):
+    assert list(iter_json_array(io.StringIO(text), chunk_size)) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", MALFORMED)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1 << 16])
+def test_iter_json_array_rejects_malformed_arrays(text, chunk_size):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), chunk_size))
+
+
+def test_iter_json_array_number_split_across_chunks():
+    # The first chunk ends within the number, "[4." must not be decoded as 4
+    assert list(iter_json_array(io.StringIO("[4.5e3]"), chunk_size=3)) == [4500.0]
+
+
+def test_iter_json_array_empty_file():
+    assert list(iter_json_array(io.StringIO(""))) == []
+
+
+class _CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.characters = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.characters += len(chunk)
+        return chunk
+
+
+@pytest.mark.parametrize(
+    "element", ['{"a": 1,, "b": 2}', '{"a": 1} x', "[1, 2]]", "4.x"]
+)
+def test_iter_json_array_raises_at_the_end_of_a_malformed_element(element):
+    text = f'[{{"a": 0}}, {element}, ' + ", ".join(['{"a": 1}'] * 10_000) + "]"
+    file = _CountingReader(text)
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(file, chunk_size=64))
+    assert file.characters < 200
+
+
+def test_iter_json_array_reports_the_byte_offset():
+    # "ü" takes two bytes, the malformed element starts at byte 17
+    with pytest.raises(ValueError, match="at byte 17"):
+        list(iter_json_array(io.StringIO('[{"a": "ü"}, 1, {"b" 2}]'), chunk_size=4))
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from util import RunningMoments, normalize_scores
+
+
+def test_running_moments_match_normalize_scores():
+    rng = np.random.default_rng(0)
+    scores = rng.normal(10, 3, size=1000)
+    groups = rng.choice(["a", "b", "c"], size=1000)
+
+    moments = RunningMoments()
+    for start in range(0, 1000, 70):
+        moments.update(scores[start : start + 70], groups[start : start + 70])
+
+    np.testing.assert_allclose(
+        moments.normalize(scores, groups), normalize_scores(scores, groups)
+    )
+
+
+def test_running_moments_merge():
+    rng = np.random.default_rng(1)
+    scores = rng.normal(size=500)
+
+    first, second = RunningMoments(), RunningMoments()
+    first.update(scores[:200])
+    second.update(scores[200:])
+
+    np.testing.assert_allclose(
+        first.merge(second).normalize(scores), normalize_scores(scores)
+    )
+
+
+def test_running_moments_chunk_with_only_nan_scores_of_a_group():
+    moments = RunningMoments()
+    moments.update([1, 2, 3, 4], ["a", "a", "b", "b"])
+    moments.update([np.nan, 5], ["a", "b"])
+
+    result = moments.moments()
+    assert result.loc["a", "n"] == 2
+    assert result.loc["a", "mean"] == pytest.approx(1.5)
+    assert result.loc["a", "std"] == pytest.approx(0.5)
+    assert result.loc["b", "mean"] == pytest.approx(4)
+
+
+@pytest.mark.parametrize("groups", [None, ["a", "b", "a", "b", "a"]])
+def test_normalize_scores_returns_an_array_in_input_order(groups):
+    scores = pd.Series([4.0, 1.0, 2.0, 3.0, 6.0], index=[9, 3, 5, 1, 7])
+
+    z_scores = normalize_scores(scores, groups)
+
+    assert isinstance(z_scores, np.ndarray)
+    np.testing.assert_allclose(
+        z_scores, RunningMoments().update(scores, groups).normalize(scores, groups)
+    )
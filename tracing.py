@@ -0,0 +1,339 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from instrumentation import traced
+
+TRACING_PATH = "abzuege/tracing.csv"
+
+# Fixed schema of the tracing exports, the mastery is written with a decimal comma
+TRACING_DTYPES = {"UserId": "category", "SkillId": "category", "Mastery": "float32"}
+DATE_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+CHUNK_SIZE = 1_000_000
+
+
+def iter_tracing(path=TRACING_PATH, chunksize=CHUNK_SIZE):
+    """
+    Streams the tracing export in chunks of at most `chunksize` rows, each chunk is sorted by Date.
+    Only a single chunk is held in memory at a time.
+    """
+    reader = pd.read_csv(
+        path,
+        dtype=TRACING_DTYPES,
+        decimal=",",
+        parse_dates=["Date"],
+        date_format=DATE_FORMAT,
+        encoding="utf-8-sig",
+        chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            yield chunk.sort_values("Date", kind="stable", ignore_index=True)
+
+
+def concat_tracing(chunks):
+    """
+    Concatenates tracing chunks, the categories of UserId and SkillId are unified instead of falling back to strings
+    """
+    # Empty chunks carry no categories and would break the unification
+    chunks = [chunk for chunk in chunks if len(chunk)]
+    if not chunks:
+        return pd.DataFrame(
+            {
+                "Date": pd.Series(dtype="datetime64[ns]"),
+                **{
+                    column: pd.Series(dtype=dtype)
+                    for column, dtype in TRACING_DTYPES.items()
+                },
+            }
+        )
+
+    data = pd.DataFrame(
+        {
+            "Date": pd.concat([chunk["Date"] for chunk in chunks], ignore_index=True),
+            "UserId": union_categoricals(
+                [chunk["UserId"] for chunk in chunks], sort_categories=True
+            ),
+            "SkillId": union_categoricals(
+                [chunk["SkillId"] for chunk in chunks], sort_categories=True
+            ),
+            "Mastery": pd.concat(
+                [chunk["Mastery"] for chunk in chunks], ignore_index=True
+            ),
+        }
+    )
+    # The chunks are already sorted runs, which the stable sort merges cheaply
+    return data.sort_values("Date", kind="stable", ignore_index=True)
+
+
+@traced()
+def load_tracing(path=TRACING_PATH, chunksize=CHUNK_SIZE):
+    """
+    Loads the whole tracing export sorted by Date, with categorical UserId/SkillId and float32 Mastery
+    """
+    return concat_tracing(iter_tracing(path, chunksize=chunksize))
+
+
+def write_tracing_partitions(output_dir, path=TRACING_PATH, chunksize=CHUNK_SIZE):
+    """
+    Appends every sorted chunk of the export as its own parquet partition to output_dir.
+    Memory stays bounded by the chunk size regardless of the size of the export.
+    Returns the paths of the written partitions.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    partitions = []
+    for i, chunk in enumerate(iter_tracing(path, chunksize=chunksize)):
+        partition = os.path.join(output_dir, f"part-{i:05d}.parquet")
+        chunk.to_parquet(partition, index=False)
+        partitions.append(partition)
+
+    return partitions
+
+
+def read_tracing_partitions(partitions):
+    """
+    Yields the partitions written by write_tracing_partitions one after another
+    """
+    for partition in partitions:
+        yield pd.read_parquet(partition)
+
+
+class MasteryStore:
+    """
+    Index over the tracing entries sorted once by (UserId, SkillId, Date).
+    Offset tables turn the series of a user or of a (user, skill) pair into an O(1) slice,
+    point-in-time queries use binary search on the sorted entries.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        users = data["UserId"].astype("category")
+        skills = data["SkillId"].astype("category")
+        dates = data["Date"].to_numpy()
+
+        user_codes = users.cat.codes.to_numpy().astype(np.int64)
+        skill_codes = skills.cat.codes.to_numpy().astype(np.int64)
+        order = np.lexsort((dates, skill_codes, user_codes))
+
+        self.users = users.cat.categories
+        self.skills = skills.cat.categories
+        self._user_lookup = pd.Index(self.users)
+        self._skill_lookup = pd.Index(self.skills)
+
+        self.user_codes = user_codes[order]
+        self.skill_codes = skill_codes[order]
+        self.dates = dates[order]
+        self.mastery = data["Mastery"].to_numpy()[order]
+
+        n_users, n_skills = len(self.users), len(self.skills)
+
+        # Offsets of every user within the sorted entries
+        self._user_offsets = np.searchsorted(self.user_codes, np.arange(n_users + 1))
+
+        # Segments are the consecutive entries of one (user, skill) pair
+        pair_key = self.user_codes * n_skills + self.skill_codes
+        boundaries = np.flatnonzero(np.diff(pair_key)) + 1
+        self._segment_starts = np.concatenate([[0], boundaries]).astype(np.int64)
+        self._segment_ends = np.concatenate([boundaries, [len(pair_key)]]).astype(
+            np.int64
+        )
+        if len(pair_key) == 0:
+            self._segment_starts = self._segment_ends = np.empty(0, dtype=np.int64)
+        self._segment_users = self.user_codes[self._segment_starts]
+        self._segment_skills = self.skill_codes[self._segment_starts]
+
+        # Dense (user, skill) -> segment table, -1 marks pairs without entries
+        self._segment_table = np.full((n_users, n_skills), -1, dtype=np.int64)
+        self._segment_table[self._segment_users, self._segment_skills] = np.arange(
+            len(self._segment_starts)
+        )
+
+        # Sorted composite key of (segment, rank of the date) for point-in-time queries
+        self._times = np.unique(self.dates)
+        row_segments = np.repeat(
+            np.arange(len(self._segment_starts)),
+            self._segment_ends - self._segment_starts,
+        )
+        self._time_key = row_segments * len(self._times) + np.searchsorted(
+            self._times, self.dates
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _user_code(self, user_id):
+        code = self._user_lookup.get_indexer([user_id])[0]
+        if code < 0:
+            raise KeyError(user_id)
+        return code
+
+    def _skill_code(self, skill_id):
+        code = self._skill_lookup.get_indexer([skill_id])[0]
+        if code < 0:
+            raise KeyError(skill_id)
+        return code
+
+    def _frame(self, start, end, with_skill=True):
+        frame = {"Date": self.dates[start:end]}
+        if with_skill:
+            frame["SkillId"] = pd.Categorical.from_codes(
+                self.skill_codes[start:end], categories=self.skills
+            )
+        frame["Mastery"] = self.mastery[start:end]
+        return pd.DataFrame(frame)
+
+    def user(self, user_id):
+        """
+        All entries of the user sorted by SkillId and Date
+        """
+        code = self._user_code(user_id)
+        return self._frame(self._user_offsets[code], self._user_offsets[code + 1])
+
+    def user_skills(self, user_id):
+        """
+        Skills with at least one entry for the user
+        """
+        segments = self._segment_table[self._user_code(user_id)]
+        return self.skills[segments >= 0]
+
+    def series(self, user_id, skill_id):
+        """
+        Mastery of the user for the skill sorted by Date
+        """
+        segment = self._segment_table[
+            self._user_code(user_id), self._skill_code(skill_id)
+        ]
+        if segment < 0:
+            return self._frame(0, 0, with_skill=False)
+        return self._frame(
+            self._segment_starts[segment],
+            self._segment_ends[segment],
+            with_skill=False,
+        )
+
+    def mastery_at(self, time):
+        """
+        Latest mastery of every (user, skill) pair at the given point in time.
+        Pairs without an entry up to that time have a NaN mastery.
+        """
+        time = np.datetime64(pd.Timestamp(time)).astype(self._times.dtype)
+        segments = np.arange(len(self._segment_starts))
+
+        # Last entry of each segment with a date rank below the number of dates <= time
+        rank = np.searchsorted(self._times, time, side="right")
+        positions = (
+            np.searchsorted(self._time_key, segments * len(self._times) + rank) - 1
+        )
+        observed = positions >= self._segment_starts
+
+        mastery = np.full(len(segments), np.nan)
+        mastery[observed] = self.mastery[positions[observed]]
+        dates = np.full(len(segments), np.datetime64("NaT"), dtype=self.dates.dtype)
+        dates[observed] = self.dates[positions[observed]]
+
+        return pd.DataFrame(
+            {
+                "UserId": pd.Categorical.from_codes(
+                    self._segment_users, categories=self.users
+                ),
+                "SkillId": pd.Categorical.from_codes(
+                    self._segment_skills, categories=self.skills
+                ),
+                "Date": dates,
+                "Mastery": mastery,
+            }
+        )
+
+    def resample(self, grid, method="step"):
+        """
+        Mastery of every (user, skill) pair at the times of the grid as dense [users x skills x time] array,
+        ordered like self.users and self.skills. "step" holds the latest entry, "linear" interpolates
+        between the entries around each time and holds the last entry afterwards.
+        Times before the first entry of a pair and pairs without entries are NaN.
+        """
+        if method not in ("step", "linear"):
+            raise ValueError(method)
+
+        grid = pd.DatetimeIndex(grid).to_numpy().astype(self.dates.dtype)
+        segments = np.arange(len(self._segment_starts))
+        starts = self._segment_starts[:, np.newaxis]
+        ends = self._segment_ends[:, np.newaxis]
+
+        # Latest entry of every segment at every grid time, one batched binary search over (segment, time)
+        rank = np.searchsorted(self._times, grid, side="right")
+        positions = (
+            np.searchsorted(
+                self._time_key,
+                segments[:, np.newaxis] * len(self._times) + rank[np.newaxis, :],
+            )
+            - 1
+        )
+        observed = positions >= starts
+
+        values = np.full(positions.shape, np.nan)
+        values[observed] = self.mastery[positions[observed]]
+
+        if method == "linear":
+            following = positions + 1
+            inner = observed & (following < ends)
+            before = positions[inner]
+            after = following[inner]
+            times = np.broadcast_to(grid, positions.shape)[inner].astype(np.int64)
+            start = self.dates[before].astype(np.int64)
+            end = self.dates[after].astype(np.int64)
+            values[inner] += (self.mastery[after] - values[inner]) * (
+                (times - start) / (end - start)
+            )
+
+        dense = np.full((len(self.users), len(self.skills), len(grid)), np.nan)
+        dense[self._segment_users, self._segment_skills] = values
+        return dense
+
+    def cohort_bands(self, grid, cohorts, method="step", quantiles=(0.25, 0.75)):
+        """
+        Mean and quantiles of the resampled mastery (see resample) within each cohort, per skill and grid time.
+        cohorts maps UserId to the label of the cohort, users without a cohort are left out.
+        Returns one row per (cohort, SkillId, Date) with the number of users observed at that time.
+        """
+        grid = pd.DatetimeIndex(grid)
+        values = self.resample(grid, method)
+        labels = pd.Series(cohorts).reindex(self.users).to_numpy()
+
+        frames = []
+        for cohort in sorted(pd.unique(labels[pd.notna(labels)])):
+            members = values[labels == cohort]
+            observed = (~np.isnan(members)).sum(axis=0)
+            with warnings.catch_warnings():
+                # Skills and times without any observed user result in NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                mean = np.nanmean(members, axis=0)
+                bands = np.nanquantile(members, quantiles, axis=0)
+
+            frame = pd.DataFrame(
+                {
+                    "cohort": cohort,
+                    "SkillId": np.repeat(self.skills, len(grid)),
+                    "Date": np.tile(grid, len(self.skills)),
+                    "users": observed.ravel(),
+                    "mean": mean.ravel(),
+                }
+            )
+            for quantile, band in zip(quantiles, bands):
+                frame[f"q{quantile:g}"] = band.ravel()
+            frames.append(frame)
+
+        if not frames:
+            # No user belongs to any of the cohorts
+            return pd.DataFrame(
+                columns=[
+                    "cohort",
+                    "SkillId",
+                    "Date",
+                    "users",
+                    "mean",
+                    *(f"q{quantile:g}" for quantile in quantiles),
+                ]
+            )
+        return pd.concat(frames, ignore_index=True)
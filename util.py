@@ -1,22 +1,328 @@
+import hashlib
+import json
 import math
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
-from scipy.stats import ttest_rel, ttest_ind, shapiro, wilcoxon, mannwhitneyu
 from math import sqrt
 from statistics import mean, stdev
 import os  # Added for directory existence check
+from contextlib import contextmanager
+from functools import lru_cache
+import instrumentation
+from instrumentation import traced
+
+# matplotlib, seaborn and scipy are imported on first use as they dominate the import time of this module
+
+# Render queue, figures are drawn within worker processes while it is active
+_render_pool = None
+_pending_renders = []
+
+# Manifest of the figures written to a directory, maps each file to the digest of the plot it holds.
+# Figures whose digest and file are unchanged are not rendered again, AZUBEE_FIGURE_CACHE=0 renders all figures anew.
+FIGURE_MANIFEST = ".figures.json"
+_figure_cache = os.environ.get("AZUBEE_FIGURE_CACHE", "1") != "0"
 
 
 # Calculate Z-Score
-def normalize_scores(scores):
+def normalize_scores(scores, groups=None):
+    """
+    Z-scores of the scores, with groups (array or Series aligned with the scores, e.g. the skill or cohort of each score)
+    every score is normalized with the mean and standard deviation of its group.
+    Returns an array in the order of the scores, as RunningMoments.normalize.
+    """
+    scores = np.asarray(scores, dtype=float)
+    if groups is not None:
+        import pandas as pd
+
+        grouped = pd.Series(scores).groupby(np.asarray(groups), observed=True)
+        return (
+            (scores - grouped.transform("mean")) / grouped.transform("std", ddof=0)
+        ).to_numpy()
+
     mean = np.mean(scores)
     std = np.std(scores)
     z_scores = (scores - mean) / std
     return z_scores
 
 
+class RunningMoments:
+    """
+    Mergeable Welford accumulators of the count, mean and sum of squared deviations of scores, per group.
+    Scores arrive in chunks (update) or from other accumulators (merge), e.g. the chunks of the tracing data
+    or a growing cohort, without holding the scores in memory. Each chunk is reduced with grouped sums and
+    combined with the running moments by the pairwise update of Chan et al. (1979).
+    """
+
+    def __init__(self):
+        import pandas as pd
+
+        self._moments = pd.DataFrame({"n": [], "mean": [], "m2": []})
+
+    @staticmethod
+    def _keys(scores, groups):
+        # Ungrouped scores share a single group
+        return (
+            np.zeros(len(scores), dtype=int) if groups is None else np.asarray(groups)
+        )
+
+    def _combine(self, other):
+        # Groups without any score in the other moments (e.g. only NaN scores) keep their running moments
+        other = other.loc[other["n"] > 0]
+        index = self._moments.index.union(other.index)
+        a = self._moments.reindex(index, fill_value=0)
+        b = other.reindex(index, fill_value=0)
+
+        n = a["n"] + b["n"]
+        delta = b["mean"] - a["mean"]
+        share = (b["n"] / n).fillna(0)
+        self._moments = a.assign(
+            n=n,
+            mean=a["mean"] + delta * share,
+            m2=a["m2"] + b["m2"] + delta**2 * a["n"] * share,
+        )
+        return self
+
+    def update(self, scores, groups=None):
+        """
+        Adds a chunk of scores, NaN scores are skipped
+        """
+        import pandas as pd
+
+        grouped = pd.Series(np.asarray(scores, dtype=float)).groupby(
+            self._keys(scores, groups), observed=True
+        )
+        chunk = grouped.agg(["count", "mean", "var"])
+        return self._combine(
+            pd.DataFrame(
+                {
+                    "n": chunk["count"].astype(float),
+                    "mean": chunk["mean"],
+                    "m2": (chunk["var"] * (chunk["count"] - 1)).fillna(0),
+                }
+            )
+        )
+
+    def merge(self, other):
+        """
+        Adds the moments of another accumulator, e.g. of a chunk processed elsewhere
+        """
+        return self._combine(other._moments)
+
+    def moments(self, ddof=0):
+        """
+        Count, mean and standard deviation per group
+        """
+        return self._moments.assign(
+            std=np.sqrt(self._moments["m2"] / (self._moments["n"] - ddof))
+        )[["n", "mean", "std"]]
+
+    def normalize(self, scores, groups=None):
+        """
+        Z-scores of the scores with the moments accumulated so far (population standard deviation, as normalize_scores)
+        """
+        moments = self.moments()
+        keys = self._keys(scores, groups)
+        mean = moments["mean"].reindex(keys).to_numpy()
+        std = moments["std"].reindex(keys).to_numpy()
+        return (np.asarray(scores, dtype=float) - mean) / std
+
+
+@lru_cache(maxsize=None)
+def _pyplot():
+    import matplotlib
+
+    # Figures are only written to files, a non-interactive backend keeps headless runs working
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+@lru_cache(maxsize=None)
+def _seaborn():
+    import seaborn as sns
+
+    return sns
+
+
+def start_render_queue(max_workers=None):
+    """
+    Starts rendering figures within a process pool (one worker per core by default).
+    The render helpers only record the plot and return immediately until flush_renders is called.
+    """
+    global _render_pool
+    if _render_pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+
+        _render_pool = ProcessPoolExecutor(max_workers=max_workers)
+
+
+def flush_renders():
+    """
+    Waits until all queued figures are written, errors of the workers are raised here
+    """
+    global _pending_renders
+    pending, _pending_renders = _pending_renders, []
+    for future, path, digest in pending:
+        instrumentation.merge_spans(future.result())
+        _record_figure(path, digest)
+
+
+def stop_render_queue():
+    global _render_pool
+    try:
+        flush_renders()
+    finally:
+        if _render_pool is not None:
+            _render_pool.shutdown()
+            _render_pool = None
+
+
+@contextmanager
+def render_queue(max_workers=None):
+    start_render_queue(max_workers=max_workers)
+    try:
+        yield
+    finally:
+        stop_render_queue()
+
+
+def _update_digest(sha, value):
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        sha.update(f"ndarray {value.dtype} {value.shape}".encode())
+        sha.update(np.ascontiguousarray(value).tobytes())
+    elif hasattr(value, "index") and type(value).__module__.startswith("pandas"):
+        # Series and DataFrames, the values are hashed together with the index
+        from pandas.util import hash_pandas_object
+
+        dtypes = list(value.dtypes) if value.ndim > 1 else [value.dtype]
+        labels = list(value.columns) if value.ndim > 1 else [value.name]
+        sha.update(f"{type(value).__name__} {labels} {dtypes}".encode())
+        _update_digest(sha, hash_pandas_object(value).to_numpy())
+    elif isinstance(value, dict):
+        sha.update(b"dict")
+        for key in sorted(value):
+            _update_digest(sha, key)
+            _update_digest(sha, value[key])
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        sha.update(f"{type(value).__name__} {len(value)}".encode())
+        for item in value:
+            _update_digest(sha, item)
+    else:
+        sha.update(repr(value).encode())
+
+
+@lru_cache(maxsize=None)
+def _render_code(render):
+    # The styling is part of the render function, its source and the plotting libraries identify the look of a figure
+    import inspect
+    from importlib.metadata import PackageNotFoundError, version
+
+    versions = []
+    for package in ("matplotlib", "seaborn"):
+        try:
+            versions.append(version(package))
+        except PackageNotFoundError:
+            versions.append(None)
+    return f"{render.__qualname__} {versions}\n{inspect.getsource(render)}"
+
+
+def _figure_digest(render, args, kwargs):
+    sha = hashlib.sha256(_render_code(render).encode())
+    _update_digest(sha, args)
+    _update_digest(sha, kwargs)
+    return sha.hexdigest()
+
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, FIGURE_MANIFEST)) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict()
+
+
+def _is_up_to_date(path, digest):
+    entry = _load_manifest(os.path.dirname(path)).get(os.path.basename(path))
+    if entry is None or entry["digest"] != digest or not os.path.exists(path):
+        return False
+    # Files replaced since they were recorded are rendered again
+    stat = os.stat(path)
+    return entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+
+def _record_figure(path, digest):
+    if not os.path.exists(path):
+        return
+
+    directory = os.path.dirname(path)
+    stat = os.stat(path)
+    # Other processes (e.g. the concurrent studies of the pipeline) may have recorded figures of the same
+    # directory meanwhile, the manifest is read again right before it is replaced. A lost entry only causes a re-render.
+    manifest = _load_manifest(directory)
+    manifest[os.path.basename(path)] = {
+        "digest": digest,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    manifest_path = os.path.join(directory, FIGURE_MANIFEST)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _render_in_worker(trace_memory, render, *args, **kwargs):
+    # Runs within a worker of the render queue, returns the spans of the render to the parent if it is tracing
+    if trace_memory is None:
+        render(*args, **kwargs)
+        return []
+
+    instrumentation.enable(trace_memory=trace_memory)
+    instrumentation.reset()
+    render(*args, **kwargs)
+    return instrumentation.export_spans()
+
+
+def _submit_render(path, render, *args, **kwargs):
+    """
+    Renders the figure written to path, unless the manifest of its directory shows that the file already
+    holds the plot of the same arguments and render code
+    """
+    digest = _figure_digest(render, args, kwargs)
+    if _figure_cache and _is_up_to_date(path, digest):
+        return
+
+    if _render_pool is None:
+        render(*args, **kwargs)
+        _record_figure(path, digest)
+    else:
+        trace_memory = (
+            instrumentation.is_tracing_memory()
+            if instrumentation.is_enabled()
+            else None
+        )
+        future = _render_pool.submit(
+            _render_in_worker, trace_memory, render, *args, **kwargs
+        )
+        _pending_renders.append((future, path, digest))
+
+
 def render_boxplot(trained, untrained, filename, labels, title=""):
+    _submit_render(
+        f"img/{filename}.png",
+        _render_boxplot,
+        trained,
+        untrained,
+        filename,
+        labels,
+        title,
+    )
+
+
+@traced("render boxplot")
+def _render_boxplot(trained, untrained, filename, labels, title):
+    plt = _pyplot()
+
     plt.title(title)
     plt.boxplot([trained, untrained], patch_artist=True, labels=labels)
     plt.savefig(f"img/{filename}.png")
@@ -24,6 +330,13 @@ def render_boxplot(trained, untrained, filename, labels, title=""):
 
 
 def render_barplot(x, y, filename, title=""):
+    _submit_render(f"img/{filename}.png", _render_barplot, x, y, filename, title)
+
+
+@traced("render barplot")
+def _render_barplot(x, y, filename, title):
+    plt = _pyplot()
+
     plt.bar(x, y)
     plt.title(title)
     plt.savefig(f"img/{filename}.png")
@@ -46,10 +359,22 @@ def render_comparison_histogram(
 
 # Enhanced function to render comparison histograms with more customization
 def render_comparison_histograms(data_list, x_label, filename, output_dir="img"):
-    if not os.path.exists(
-        output_dir
-    ):  # Check if the output directory exists, create if not
-        os.makedirs(output_dir)
+    _submit_render(
+        os.path.join(output_dir, f"{filename}.png"),
+        _render_comparison_histograms,
+        data_list,
+        x_label,
+        filename,
+        output_dir,
+    )
+
+
+@traced("render comparison histograms")
+def _render_comparison_histograms(data_list, x_label, filename, output_dir):
+    plt, sns = _pyplot(), _seaborn()
+
+    # Create the output directory if it does not exist, workers may race for it
+    os.makedirs(output_dir, exist_ok=True)
 
     num_plots = len(data_list)
     num_cols = 2
@@ -70,6 +395,13 @@ def render_comparison_histograms(data_list, x_label, filename, output_dir="img")
 
 
 def plot_pre_post(df, filename, title):
+    _submit_render(f"img/{filename}.png", _plot_pre_post, df, filename, title)
+
+
+@traced("render pre post")
+def _plot_pre_post(df, filename, title):
+    plt = _pyplot()
+
     plt.figure(figsize=(10, 6))
 
     # We set the width of a bar and its positions
@@ -105,7 +437,47 @@ def plot_pre_post(df, filename, title):
     plt.close()
 
 
+def render_power_curves(table, filename, alpha=0.05, output_dir="img"):
+    _submit_render(
+        os.path.join(output_dir, f"{filename}.png"),
+        _render_power_curves,
+        table,
+        filename,
+        alpha,
+        output_dir,
+    )
+
+
+@traced("render power curves")
+def _render_power_curves(table, filename, alpha, output_dir):
+    plt = _pyplot()
+
+    os.makedirs(output_dir, exist_ok=True)
+    plt.figure(figsize=(10, 6))
+
+    # One curve per effect size over the number of users per sample
+    for effect, cell in table.groupby("effect", sort=True):
+        plt.errorbar(
+            cell["n"],
+            cell["power"],
+            yerr=cell["power_se"],
+            marker="o",
+            capsize=3,
+            label=f"d = {effect:g}",
+        )
+    plt.axhline(0.8, color="grey", linestyle="--")
+    plt.axhline(alpha, color="grey", linestyle=":")
+
+    plt.xlabel("Users per sample")
+    plt.ylabel("Power")
+    plt.ylim(0, 1)
+    plt.legend()
+    plt.savefig(f"{output_dir}/{filename}.png")
+    plt.close()
+
+
 def calculate_cohends_d(dist_1, dist_2):
+    dist_1, dist_2 = np.asarray(dist_1, dtype=float), np.asarray(dist_2, dtype=float)
     n1, n2 = len(dist_1), len(dist_2)
     s1, s2 = stdev(dist_1), stdev(dist_2)
     x1, x2 = mean(dist_1), mean(dist_2)
@@ -114,6 +486,7 @@ def calculate_cohends_d(dist_1, dist_2):
     return (x1 - x2) / pooled_std
 
 
+@traced()
 def perform_test(
     a,
     b,
@@ -127,9 +500,11 @@ def perform_test(
     alternative="greater",
     output_dir="img",
 ):
-    a, b = np.array(a), np.array(
-        b
-    )  # Ensure inputs are numpy arrays for statistical operations
+    from scipy.stats import ttest_rel, ttest_ind, shapiro
+    from rank_tests import rank_test_rows
+
+    # Ensure inputs are float64 arrays for statistical operations
+    a, b = np.array(a, dtype=float), np.array(b, dtype=float)
 
     if len(a) == 0 or len(b) == 0:
         raise ValueError("Input arrays must not be empty.")
@@ -166,25 +541,21 @@ def perform_test(
             f"Test result: statistic={test_result.statistic}, p-value={test_result.pvalue}"
         )
     else:
+        # Small samples look up their p-values in the memoized exact null distributions
+        statistic, pvalue = rank_test_rows(
+            a[np.newaxis], b[np.newaxis], is_related, alternative
+        )
+        statistic, pvalue = statistic[0], pvalue[0]
         if is_related:
-            test_result = wilcoxon(
-                a,
-                b,
-                alternative=alternative,
-                # https://www.tandfonline.com/doi/abs/10.1080/01621459.1959.10501526
-                zero_method="pratt",
-            )
             test_name = "Wilcoxon test"
         else:
-            test_result = mannwhitneyu(a, b, alternative=alternative)
             test_name = "Mann-Whitney U test"
 
         print(
             f"Using {test_name} as normality assumptions are not met for {filename}."
             f", std_a={std_a}, std_b={std_b}, mean_a={mean_a}, mean_b={mean_b}"
         )
-        print(
-            f"Test result: statistic={test_result.statistic}, p-value={test_result.pvalue}"
-        )
+        print(f"Test result: statistic={statistic}, p-value={pvalue}")
+        return statistic, pvalue, test_name
 
     return test_result.statistic, test_result.pvalue, test_name